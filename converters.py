@@ -5,10 +5,13 @@ Converters for CSV cell data
 """
 
 import datetime
+import functools
 import logging
 import re
 import requests
+from collections import Counter, defaultdict
 
+from jellyfish import damerau_levenshtein_distance
 from rdflib import Graph, Literal
 from slugify import slugify
 
@@ -16,6 +19,11 @@ from namespaces import *
 
 log = logging.getLogger(__name__)
 
+RE_NAME_SPLIT = re.compile(
+    r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)')
+RE_PREV_NAME = re.compile(r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?')
+RE_NAME_LIST_SEPARATOR = re.compile(r'\s*[,&/]\s*|\s+ja\s+')
+
 
 def convert_int(raw_value: str):
     """
@@ -58,24 +66,21 @@ def convert_dates(raw_date: str):
         return raw_date
 
 
+@functools.lru_cache(maxsize=None)
 def convert_person_name(raw_name: str):
     """
-    Unify name syntax and split into first names and last name
+    Unify name syntax and split into first names and last name. Results are memoized per distinct name.
 
     :param raw_name: Original name string
     :return: tuple containing first names, last name and full name
     """
-    re_name_split = \
-        r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)'
-
     fullname = raw_name.upper()
 
-    namematch = re.search(re_name_split, fullname)
+    namematch = RE_NAME_SPLIT.search(fullname)
     (lastname, extra, firstnames) = namematch.groups() if namematch else (fullname, None, '')
 
     # Unify syntax for previous names
-    prev_name_regex = r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?'
-    lastname = re.sub(prev_name_regex, r'\1 (ent. \3)', str(lastname))
+    lastname = RE_PREV_NAME.sub(r'\1 (ent. \3)', str(lastname))
 
     lastname = lastname.title().replace('(Ent. ', '(ent. ')
     firstnames = firstnames.title()
@@ -98,6 +103,157 @@ def convert_person_name(raw_name: str):
     return firstnames, lastname, fullname
 
 
+def normalize_name_token(token: str):
+    """
+    Unify capitalization of a name token, e.g. 'HIrvonen' -> 'Hirvonen', 'esa-matti' -> 'Esa-Matti'
+    """
+    return '-'.join(part[:1].upper() + part[1:].lower() for part in token.split('-'))
+
+
+@functools.lru_cache(maxsize=None)
+def split_person_names(raw_value: str):
+    """
+    Split a list of person names written as 'First Last' (e.g. 'Seppo Holopainen ja Heikki Simpura') and unify
+    their capitalization. A lone first name shares the last name of the following name, as in
+    'Paavo ja Jaana Haapamäki'. Other single-word values are not considered names.
+
+    :param raw_value: original string value
+    :return: tuple of names
+    """
+    parts = [part for part in RE_NAME_LIST_SEPARATOR.split(raw_value.strip()) if part]
+    names = []
+    for i, part in enumerate(parts):
+        tokens = part.split()
+        if len(tokens) == 1:
+            following = parts[i + 1].split() if i + 1 < len(parts) else []
+            if len(following) < 2:
+                continue
+            tokens += following[-1:]
+        names.append(' '.join(normalize_name_token(token) for token in tokens))
+    return tuple(names)
+
+
+def cluster_person_names(names, max_distance=1, min_length=6):
+    """
+    Cluster spelling variants of person names. Two names are clustered if their first names match and their
+    surnames are within max_distance Damerau-Levenshtein edits, or if their surnames match and their first names are
+    within max_distance edits. Only names of at least min_length letters are compared by edit distance, as short
+    names differing by a letter (e.g. Anna and Anne, Jari and Jani) are usually different names. Names are blocked by
+    the initials of their first and last word and compared only within a block. The most common spelling in a
+    cluster is used as its representative.
+
+    :param names: iterable of unified names, each repeated as many times as it occurs
+    :param max_distance: maximum edit distance between a name part and that of the cluster representative
+    :param min_length: minimum length of a name part compared by edit distance, shorter parts must match exactly
+    :return: dict of name -> representative name
+    """
+    def similar(a, b):
+        return a == b or (min(len(a), len(b)) >= min_length and damerau_levenshtein_distance(a, b) <= max_distance)
+
+    counts = Counter(names)
+    blocks = defaultdict(list)
+    clusters = {}
+
+    for name, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        tokens = name.casefold().split()
+        first_names, surname = ' '.join(tokens[:-1]), tokens[-1]
+        block = blocks[(tokens[0][0], surname[0])]
+
+        for representative, representative_first_names, representative_surname in block:
+            if ((first_names == representative_first_names and similar(surname, representative_surname)) or
+                    (surname == representative_surname and similar(first_names, representative_first_names))):
+                clusters[name] = representative
+                break
+        else:
+            block.append((name, first_names, surname))
+            clusters[name] = name
+
+    return clusters
+
+
+@functools.lru_cache(maxsize=None)
+def cached_slugify(value):
+    """
+    Memoized slugify
+    """
+    return slugify(value)
+
+
+def date_timespan(value):
+    """
+    Convert a converted date value to a timespan of ISO 8601 dates. A year is converted to a timespan covering the
+    whole year.
+
+    :param value: datetime.date or raw date string from convert_dates
+    :return: tuple (begin, end) or None if the value is not a date or a year
+    """
+    if isinstance(value, datetime.date):
+        return value.isoformat(), value.isoformat()
+    if isinstance(value, str) and re.fullmatch(r'\d{4}', value.strip()):
+        return value.strip() + '-01-01', value.strip() + '-12-31'
+    return None
+
+
+def create_events(sink, uri_suffixes, event_type, participant_prop, participants, participant_names, labels,
+                  timespans=None, places=None, prop_sources=None):
+    """
+    Create events from columns of values, adding the triples directly into sink. Unlike create_event, time-spans are
+    identified by their begin and end, so events with the same time-span share a single time-span instance.
+
+    :param sink: graph to add the triples to
+    :param uri_suffixes: list of event URI suffixes
+    :param event_type: URIRef
+    :param participant_prop:
+    :param participants: list of participants
+    :param participant_names: list of participant names for the labels
+    :param labels: label templates in Finnish and English
+    :param timespans: list of timespan tuples (begin, end), single dates or None
+    :param places: list of target place URIs or None
+    :param prop_sources:
+    """
+    count = len(uri_suffixes)
+    timespans = timespans or [None] * count
+    places = places or [None] * count
+
+    for uri_suffix, participant, participant_name, timespan, place in zip(uri_suffixes, participants,
+                                                                          participant_names, timespans, places):
+        uri = EVENTS_NS[uri_suffix]
+        sink.add((uri, RDF.type, event_type))
+        sink.add((uri, participant_prop, participant))
+        sink.add((uri, SKOS.prefLabel, Literal(labels[0].format(name=participant_name), lang='fi')))
+        sink.add((uri, SKOS.prefLabel, Literal(labels[1].format(name=participant_name), lang='en')))
+
+        if timespan:
+            if type(timespan) != tuple:
+                timespan = (timespan, timespan)
+
+            if timespan[0] != timespan[1]:
+                timespan_uri = EVENTS_NS['timespan_' + timespan[0] + '_' + timespan[1]]
+                label = timespan[0] + ' - ' + timespan[1]
+            else:
+                timespan_uri = EVENTS_NS['timespan_' + timespan[0]]
+                label = timespan[0]
+
+            sink.add((uri, CIDOC['P4_has_time-span'], timespan_uri))
+
+            if (timespan_uri, RDF.type, CIDOC['E52_Time-Span']) not in sink:
+                sink.add((timespan_uri, RDF.type, CIDOC['E52_Time-Span']))
+                sink.add((timespan_uri, CIDOC.P82a_begin_of_the_begin, Literal(timespan[0], datatype=XSD.date)))
+                sink.add((timespan_uri, CIDOC.P82b_end_of_the_end, Literal(timespan[1], datatype=XSD.date)))
+                sink.add((timespan_uri, SKOS.prefLabel, Literal(label)))
+
+                for timespan_source in prop_sources or []:
+                    sink.add((timespan_uri, DC.source, timespan_source))
+
+        if place:
+            sink.add((uri, CIDOC['P7_took_place_at'], place))
+
+            for place_source in prop_sources or []:
+                property_uri = DATA_NS['took_place_at_' + cached_slugify(place) + '_' + cached_slugify(place_source)]
+                sink.add((property_uri, DC.source, place_source))
+                sink.add((property_uri, RDFS.subClassOf, CIDOC['P7_took_place_at']))
+
+
 def create_event(uri_suffix, event_type, participant_prop, participant, participant_name, labels, timespan=None,
                  place=None, prop_sources=None, extra_information=None):
     """
@@ -159,7 +315,7 @@ def create_event(uri_suffix, event_type, participant_prop, participant, particip
             # TODO: Use singleton properties or PROV Ontology (https://www.w3.org/TR/prov-o/#qualifiedAssociation)
             for place_source in prop_sources:
                 # USING (SEMI-)SINGLETON PROPERTIES TO DENOTE SOURCE
-                property_uri = DATA_NS['took_place_at_' + slugify(place) + '_' + slugify(place_source)]
+                property_uri = DATA_NS['took_place_at_' + cached_slugify(place) + '_' + cached_slugify(place_source)]
 
                 event.add((property_uri, DC.source, place_source))
                 event.add((property_uri, RDFS.subClassOf, CIDOC['P7_took_place_at']))
@@ -266,6 +422,18 @@ def split_cemetery_name(raw_value):
         'former_municipality': former_municipality,
         'narc_name': narc_name }
 
+def normalize_place_name(raw_value: str):
+    """
+    Normalize a place name for index lookups: case-insensitive, whitespace around hyphens and repeated whitespace
+    ignored
+
+    :param raw_value: original place name
+    :return: normalized name
+    """
+    return ' '.join(re.sub(r'\s*-\s*', '-', raw_value).split()).casefold()
+
+
+@functools.lru_cache(maxsize=None)
 def geocode(raw_value):
     GOOGLE_MAPS_API_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
 
@@ -6,25 +6,137 @@ Convert cemeteries from CSV to RDF.
 
 import argparse
 # import datetime
+import glob
+import hashlib
 import logging
+import os
 # import re
+import sys
+import time
 
 
 import pandas as pd
+import pyarrow.feather as feather
 from rdflib import URIRef, Graph, Literal
 from mapping import CEMETERY_MAPPING
 from namespaces import *
 import csv
-from converters import split_cemetery_name
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from converters import split_cemetery_name, split_person_names, cluster_person_names, normalize_place_name, \
+    create_events, date_timespan
 from pathlib import Path
+from slugify import slugify
+from lookup_service import CemeteryIndex, LookupService
+from pipeline import pipelined
+from rdf_binary import write_binary
+from rdf_diff import canonical_line
+from search_documents import write_documents
+from facets import FacetCounter, facet_schema
+from url_check import check_urls
+
+PHOTO_DIR = '/m/cs/project/sotasampo-public/photographs/cemeteries/'
+#PHOTO_DIR = '/esko-local-files/hautausmaat/'
+PHOTO_SIZES = ('2048x1365px', '300x200px')
+PHOTO_URL = 'https://static.sotasampo.fi/photographs/cemeteries/'
+EMPTY_VALUES = ('ei_ole', 'ei ole', '')
+QUAD_FILENAMES = {'nquads': 'cemeteries.nq', 'trig': 'cemeteries.trig'}
+
+
+def file_hash(filename):
+    """
+    Compute SHA-1 hash of a file's contents
+
+    :param filename: path of the file
+    :return: hex digest
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def strip_strings(table):
+    """
+    Strip whitespace from all string cells of a DataFrame, leaving missing values in place
+
+    :param table: pandas DataFrame
+    :return: DataFrame with stripped string columns
+    """
+    return table.apply(lambda col: col.str.strip() if pd.api.types.is_string_dtype(col) else col)
+
+
+def read_photo_index(photo_dir=PHOTO_DIR):
+    """
+    List the photo files of each size once, so that photos can be checked without a stat call per file
+
+    :param photo_dir: directory containing a subdirectory for each photo size
+    :return: dict of photo size -> set of filenames
+    """
+    index = {}
+    for size in PHOTO_SIZES:
+        try:
+            index[size] = set(os.listdir(os.path.join(photo_dir, size)))
+        except FileNotFoundError:
+            index[size] = set()
+    return index
+
+
+def read_municipality_index(csv_file):
+    """
+    Read a municipality gazetteer dump into an index of normalized names. The CSV has columns uri, label and
+    aliases, where aliases are separated by semicolons. Former municipalities (e.g. Kylmäkoski) are listed as
+    their own rows.
+
+    :param csv_file: gazetteer CSV filename
+    :return: dict of normalized municipality name -> URIRef
+    """
+    index = {}
+    with open(csv_file, encoding='UTF-8') as f:
+        for row in csv.DictReader(f):
+            uri = URIRef(row['uri'].strip())
+            names = [row['label']] + (row.get('aliases') or '').split(';')
+            for name in names:
+                key = normalize_place_name(name)
+                if key:
+                    index.setdefault(key, uri)
+    return index
+
+
+def cemetery_labels(names, official_name):
+    """
+    Generate the labels of a cemetery
+
+    :param names: municipalities and NARC name from split_cemetery_name
+    :param official_name: official name of the cemetery from the photography project
+    :return: dict with prefLabel and optionally altLabel
+    """
+    labels = {}
+    # if official name is missing, use narc name and add
+    # municipality only if it has changed
+    if official_name == 'ei_ole':
+        if (names['former_municipality']):
+            labels['prefLabel'] = names['current_municipality'] + ', ' + names['narc_name']
+            labels['altLabel'] = names['narc_name']
+        else:
+            # only prefLabel
+            labels['prefLabel'] = names['narc_name']
+    else:
+        labels['prefLabel'] = names['current_municipality'] + ', ' + official_name
+        if labels['prefLabel'] != names['narc_name']:
+            labels['altLabel'] = names['narc_name']
+    return labels
+
 
 class RDFMapper:
     """
     Map tabular data (currently pandas DataFrame) to RDF. Create a class instance of each row.
     """
 
-    def __init__(self, mapping, instance_class, loglevel='WARNING'):
+    def __init__(self, mapping, instance_class, loglevel='WARNING', workers=8):
         self.mapping = mapping
+        self.workers = workers
         self.instance_class = instance_class
         self.table = None
         self.data = Graph()
@@ -32,6 +144,16 @@ class RDFMapper:
         self.information_objects = Graph()
         self.schema = Graph()
         self.narc_names = {}
+        self.photo_index = None
+        self.photographers = {}
+        self.municipalities = {}
+        self.unknown_municipalities = set()
+        self.row_cache = None
+        self.previous_row_cache = {}
+        self.rows_mapped = 0
+        self.changed_outputs = {0, 1, 2}
+        self.search_records = []
+        self.facets = FacetCounter()
         self.new_cemetery_id = 923
         self.photo_counter = 0
         self.cemeteries_from_project = 0
@@ -48,14 +170,69 @@ class RDFMapper:
 
         self.log = logging.getLogger(__name__)
 
-    def map_row_to_rdf(self, entity_uri, row):
+    def missing_photo_files(self, filename):
+        """
+        Check which sizes of a photo are missing from the photo directory
+
+        :param filename: photo filename
+        :return: list of missing files relative to the photo directory
+        """
+        if self.photo_index is not None:
+            return [size + '/' + filename for size in PHOTO_SIZES if filename not in self.photo_index[size]]
+        return [size + '/' + filename for size in PHOTO_SIZES if not Path(PHOTO_DIR, size, filename).is_file()]
+
+    def resolve_row(self, row):
+        """
+        Run the I/O-bound part of mapping a row: apply column converters (e.g. geocoding) and check photo files.
+
+        :param row: tabular data
+        :return: dict with converted column values and a list of missing photo files
+        """
+        values = {}
+        missing_files = []
+
+        for column_name in self.mapping:
+            value = row[column_name]
+
+            if value in EMPTY_VALUES:
+                continue
+
+            converter = self.mapping[column_name].get('converter')
+            values[column_name] = converter(value) if converter else value
+
+            if column_name.startswith('kuva_') and not column_name.endswith('kuvaajan_nimi'):
+                missing_files += self.missing_photo_files(value)
+
+        return {'values': values, 'missing_files': missing_files}
+
+    def find_municipality(self, name):
+        """
+        Find the URI of a municipality from the gazetteer index
+
+        :param name: municipality name
+        :return: URIRef or None
+        """
+        uri = self.municipalities.get(normalize_place_name(name))
+        if uri is None and name not in self.unknown_municipalities:
+            self.unknown_municipalities.add(name)
+            self.log.warning('municipality not found in gazetteer: %s' % name)
+        return uri
+
+    def map_row_to_rdf(self, entity_uri, row, resolved=None, photographs=None, information_objects=None):
         """
         Map a single row to RDF.
 
         :param entity_uri: URI of the instance being created
         :param row: tabular data
+        :param resolved: output of resolve_row for the row, resolved here if not given
+        :param photographs: graph for the row's photograph data, self.photographs if not given
+        :param information_objects: graph for the row's information objects, self.information_objects if not given
         :return:
         """
+        if resolved is None:
+            resolved = self.resolve_row(row)
+            # check if photo files exist
+            self.missing_filenames += resolved['missing_files']
 
         row_rdf = Graph()
         casualties_source_uri = WARSA_SOURCE_NS['source9']
@@ -66,14 +243,10 @@ class RDFMapper:
 
             mapping = self.mapping[column_name]
 
-            value = row[column_name]
-
-            if value == 'ei_ole' or value == 'ei ole' or value == '':
-                # print(value)
+            if column_name not in resolved['values']:
                 continue
 
-            converter = mapping.get('converter')
-            value = converter(value) if converter else value
+            value = resolved['values'][column_name]
 
             # if column_name == 'nro':
                 # print(value)
@@ -89,20 +262,7 @@ class RDFMapper:
             # use nykyiset_kunnat and hautausmaan_nimi columns to generate
             # prefLabel, altLabel, current and former municipality
             elif column_name == 'nykyiset_kunnat':
-                official_name = row['hautausmaan_nimi']
-                # if official name is missing, use narc name and add
-                # municipality only if it has changed
-                if (official_name == 'ei_ole' or value == ''):
-                    if (value['former_municipality']):
-                        value['prefLabel'] = value['current_municipality'] + ', ' + value['narc_name']
-                        value['altLabel'] = value['narc_name']
-                    else:
-                        # only prefLabel
-                        value['prefLabel'] = value['narc_name']
-                else:
-                    value['prefLabel'] = value['current_municipality'] + ', ' + official_name
-                    if value['prefLabel'] != value['narc_name']:
-                        value['altLabel'] = value['narc_name']
+                value.update(cemetery_labels(value, row['hautausmaan_nimi']))
 
             # collect all photo info and create photograph and photography instances
             elif column_name.startswith('kuva_') and not column_name.endswith('kuvaajan_nimi'):
@@ -124,22 +284,9 @@ class RDFMapper:
                 elif caption_fi == "Yleiskuva":
                     caption_en = "Panorama of the area"
 
-                # check if photo files exist
-                big_photo = Path('/m/cs/project/sotasampo-public/photographs/cemeteries/2048x1365px/' + value)
-                small_photo = Path('/m/cs/project/sotasampo-public/photographs/cemeteries/300x200px/' + value)
-                #big_photo = Path('/esko-local-files/hautausmaat/2048x1365px/' + value)
-                #small_photo = Path('esko-local-files/hautausmaat/300x200px/' + value)
-
-                if not big_photo.is_file():
-                    #self.missing_filenames.append(value)
-                    self.missing_filenames.append('2048x1365px/' + value)
-
-                if not small_photo.is_file():
-                    #self.missing_filenames.append(value)
-                    self.missing_filenames.append('300x200px/' + value)
-
                 self.create_photograph_and_photography_event_instances(value,
-                photographer, photo_club, cemetery_id, entity_uri, photo_number, caption_fi, caption_en)
+                photographer, photo_club, cemetery_id, entity_uri, photo_number, caption_fi, caption_en,
+                photographs, information_objects)
             elif column_name.endswith('kuvaajan_nimi'):
                 liter = None
             elif column_name == 'hautoja':
@@ -158,6 +305,12 @@ class RDFMapper:
                 row_rdf.add((entity_uri, mapping['current_municipality_uri'], Literal(value['current_municipality'])))
                 if value['former_municipality'] != None:
                     row_rdf.add((entity_uri, mapping['former_municipality_uri'], Literal(value['former_municipality'])))
+                if self.municipalities:
+                    for name, prop in ((value['current_municipality'], 'current_municipality_link_uri'),
+                                       (value['former_municipality'], 'former_municipality_link_uri')):
+                        municipality_uri = self.find_municipality(name) if name else None
+                        if municipality_uri:
+                            row_rdf.add((entity_uri, mapping[prop], municipality_uri))
             elif column_name == 'hautoja':
                 if number_of_graves_int != None:
                     row_rdf.add((entity_uri, mapping['uri'], Literal(number_of_graves_int, datatype=XSD.integer)))
@@ -172,23 +325,23 @@ class RDFMapper:
                 #print(mapping)
                 row_rdf.add((entity_uri, mapping['uri'], liter))
 
-            if row_rdf:
-                row_rdf.add((entity_uri, RDF.type, self.instance_class))
-                # cemetery data is based on two sources
-                row_rdf.add((entity_uri, DC.source, photo_project_source_uri))
-                row_rdf.add((entity_uri, DC.source, casualties_source_uri))
-
-            else:
-                # Don't create class instance if there is no data about it
-                logging.debug('No data found for {uri}'.format(uri=entity_uri))
+        if row_rdf:
+            row_rdf.add((entity_uri, RDF.type, self.instance_class))
+            # cemetery data is based on two sources
+            row_rdf.add((entity_uri, DC.source, photo_project_source_uri))
+            row_rdf.add((entity_uri, DC.source, casualties_source_uri))
 
+        else:
+            # Don't create class instance if there is no data about it
+            logging.debug('No data found for {uri}'.format(uri=entity_uri))
 
         return row_rdf
 
 
 
     def create_photograph_and_photography_event_instances(self, filename, photographer, photo_club, cemetery_id,
-                                                          cemetery_uri, photo_number, caption_fi, caption_en):
+                                                          cemetery_uri, photo_number, caption_fi, caption_en,
+                                                          photographs=None, information_objects=None):
 
         # URIs
         lg_uri = WARSA_MEDIA_NS['cemetery_photo_lg_' + cemetery_id + '_' + photo_number]
@@ -200,7 +353,7 @@ class RDFMapper:
         # create information objects
         io_rdf = Graph()
         io_rdf.add((lg_uri, SCHEMA_ORG.contentUrl,
-                       Literal('https://static.sotasampo.fi/photographs/cemeteries/2048x1365px/' + filename)))
+                       Literal(PHOTO_URL + '2048x1365px/' + filename)))
         io_rdf.add((lg_uri, CIDOC.P138_represents, photo_uri))
         io_rdf.add((lg_uri, RDF.type, CIDOC.E73_Information_Object))
         io_rdf.add((lg_uri, SKOS.prefLabel, Literal('Full size', 'en')))
@@ -208,14 +361,16 @@ class RDFMapper:
         io_rdf.add((lg_uri, PHOTOGRAPH_SCHEMA_NS.size, PHOTOGRAPH_SCHEMA_NS.lg))
 
         io_rdf.add((sm_uri, SCHEMA_ORG.contentUrl,
-                       Literal('https://static.sotasampo.fi/photographs/cemeteries/300x200px/' + filename)))
+                       Literal(PHOTO_URL + '300x200px/' + filename)))
         io_rdf.add((sm_uri, CIDOC.P138_represents, photo_uri))
         io_rdf.add((sm_uri, RDF.type, CIDOC.E73_Information_Object))
         io_rdf.add((sm_uri, SKOS.prefLabel, Literal('Thumbnail', 'en')))
         io_rdf.add((sm_uri, SKOS.prefLabel, Literal('Pieni', 'fi')))
         io_rdf.add((sm_uri, PHOTOGRAPH_SCHEMA_NS.size, PHOTOGRAPH_SCHEMA_NS.sm))
 
-        self.information_objects += io_rdf
+        if information_objects is None:
+            information_objects = self.information_objects
+        information_objects += io_rdf
 
         # create :Photogaph and :Photography instances
         photo_rdf = Graph()
@@ -231,28 +386,140 @@ class RDFMapper:
         photo_rdf.add((photography_uri, RDF.type, WARSA_SCHEMA_NS['Photography']))
         photo_rdf.add((photography_uri, CIDOC.P94_has_created, photo_uri))
         if (photographer != 'ei_ole'):
-            photo_rdf.add((photography_uri, CIDOC.P14_carried_out_by, Literal(photographer)))
+            for actor in self.photographers.get(photographer) or [Literal(photographer)]:
+                photo_rdf.add((photography_uri, CIDOC.P14_carried_out_by, actor))
         photo_rdf.add((photography_uri, DC.source, photo_project_source_uri))
 
-        self.photographs += photo_rdf
+        if photographs is None:
+            photographs = self.photographs
+        photographs += photo_rdf
         self.photo_counter += 1
 
-    def read_csv(self, csv_input):
+    def create_photographer_instances(self):
         """
-        Read in a CSV files using pandas.read_csv
+        Create an actor instance for each photographer in the table. Spelling variants of the same name are merged
+        into one actor, and values listing several photographers are linked to each of them.
 
-        :param csv_input: CSV input (filename or buffer)
+        :return: graph of the actor instances
+        """
+        photo_project_source_uri = WARSA_SOURCE_NS['source21']
+        columns = [column_name for column_name in self.mapping if column_name.endswith('kuvaajan_nimi')]
+        raw_names = [value for column_name in columns for value in self.table[column_name]
+                     if value not in EMPTY_VALUES]
+
+        clusters = cluster_person_names(name for raw_name in raw_names for name in split_person_names(raw_name))
+        representative_uris = {}
+        used = set()
+        for representative in sorted(set(clusters.values())):
+            # names that are not merged but have the same slug, e.g. Åke Berg and Ake Berg, get numbered URIs
+            local_name = base_name = 'cemetery_photographer_' + slugify(representative)
+            suffix = 1
+            while local_name in used:
+                suffix += 1
+                local_name = '%s_%s' % (base_name, suffix)
+            used.add(local_name)
+            representative_uris[representative] = ACTORS_NS[local_name]
+        actors = {name: representative_uris[representative] for name, representative in clusters.items()}
+
+        actor_rdf = Graph()
+        for name, representative in clusters.items():
+            actor_uri = actors[name]
+            actor_rdf.add((actor_uri, RDF.type, CIDOC.E21_Person))
+            actor_rdf.add((actor_uri, SKOS.prefLabel, Literal(representative)))
+            if name != representative:
+                actor_rdf.add((actor_uri, SKOS.altLabel, Literal(name)))
+            actor_rdf.add((actor_uri, DC.source, photo_project_source_uri))
+
+        for raw_name in set(raw_names):
+            self.photographers[raw_name] = [actors[name] for name in split_person_names(raw_name)]
+
+        self.log.info('photographer instances created: %s' % len(set(actors.values())))
+        return actor_rdf
+
+    def create_cemetery_events(self, cemeteries):
+        """
+        Create events with time-spans from the date columns that have an event defined in the mapping, e.g.
+        foundation of the cemetery. Dates that are not exact dates or years are left out.
+
+        :param cemeteries: list of (cemetery URI, cemetery name, converted column values) tuples
+        :return: graph of the events
         """
-        csv_data = pd.read_csv(csv_input, encoding='UTF-8', index_col=False, sep=',', quotechar='"',
-                               # parse_dates=[1], infer_datetime_format=True, dayfirst=True,
-                               na_values=[' '],
-                               #converters={'ammatti': lambda x: x.lower()}
-                               )
+        events_rdf = Graph()
+        sources = [WARSA_SOURCE_NS['source21']]
+
+        for column_name, mapping in self.mapping.items():
+            if 'event_type' not in mapping:
+                continue
+
+            dated = [(uri, name, date_timespan(values.get(column_name))) for uri, name, values in cemeteries]
+            dated = [(uri, name, timespan) for uri, name, timespan in dated if timespan]
+
+            create_events(events_rdf,
+                          [mapping['event_uri_prefix'] + uri.split('/')[-1] for uri, name, timespan in dated],
+                          mapping['event_type'],
+                          mapping['event_participant_uri'],
+                          [uri for uri, name, timespan in dated],
+                          [name for uri, name, timespan in dated],
+                          mapping['event_labels'],
+                          timespans=[timespan for uri, name, timespan in dated],
+                          prop_sources=sources)
+
+        return events_rdf
 
-        self.table = csv_data.fillna('').applymap(lambda x: x.strip() if type(x) == str else x)
+    def read_csv(self, csv_input, snapshot_dir=None):
+        """
+        Read in a CSV files using pandas.read_csv. Parquet and Arrow IPC (.arrow, .feather) files are read directly.
+
+        If snapshot_dir is given, the parsed and stripped table is stored there as an Arrow IPC snapshot keyed by the
+        hash of the CSV file. Later reads of the same file memory-map the snapshot instead of parsing the CSV again.
+
+        :param csv_input: CSV input (filename or buffer)
+        :param snapshot_dir: directory for typed snapshots of CSV files
+        """
+        suffix = Path(csv_input).suffix.lower() if isinstance(csv_input, (str, Path)) else ''
+        snapshot = None
+
+        if suffix == '.parquet':
+            csv_data = strip_strings(pd.read_parquet(csv_input))
+        elif suffix in ('.arrow', '.feather'):
+            csv_data = strip_strings(feather.read_table(str(csv_input), memory_map=True).to_pandas())
+        else:
+            if snapshot_dir and suffix:
+                snapshot = Path(snapshot_dir) / '{stem}-{hash}.arrow'.format(stem=Path(csv_input).stem,
+                                                                             hash=file_hash(csv_input))
+            if snapshot and snapshot.is_file():
+                csv_data = feather.read_table(str(snapshot), memory_map=True).to_pandas()
+                self.log.info('Data read from snapshot %s' % snapshot)
+            else:
+                csv_data = pd.read_csv(csv_input, encoding='UTF-8', index_col=False, sep=',', quotechar='"',
+                                       # parse_dates=[1], infer_datetime_format=True, dayfirst=True,
+                                       na_values=[' '],
+                                       #converters={'ammatti': lambda x: x.lower()}
+                                       )
+                csv_data = strip_strings(csv_data)
+
+                if snapshot:
+                    # Write to a temporary file first so that parallel runs never see a partial snapshot
+                    snapshot.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_snapshot = snapshot.with_suffix('.%s.tmp' % os.getpid())
+                    feather.write_feather(csv_data, str(tmp_snapshot))
+                    os.replace(str(tmp_snapshot), str(snapshot))
+                    self.log.info('Snapshot of CSV written to %s' % snapshot)
+
+        self.table = csv_data.fillna('')
         self.log.info('Data read from CSV %s' % csv_input)
 
-    def read_narc_cemetery_uris_from_csv(self):
+    def read_narc_cemetery_uris_from_csv(self, narc_names=None):
+        """
+        Read the cemetery URIs and labels already in WarSampo
+
+        :param narc_names: previously read index to copy instead of reading the CSV again
+        """
+        if narc_names is not None:
+            self.narc_names = dict(narc_names)
+            self.cemeteries_already_in_warsampo = len(self.narc_names.keys())
+            return
+
         reader = csv.DictReader(open('cemetery-uris-labels-narc.csv'))
         for row in reader:
             label = row.pop('original_narc_name').rstrip()
@@ -277,15 +544,74 @@ class RDFMapper:
             cemetery_rdf.add((cemetery_uri, SKOS.prefLabel, Literal(cemeteries[key][1])))
         return cemetery_rdf
 
-    def serialize(self, destination_data, destination_photographs, destination_ios, destination_schema):
+    def serialize(self, destination_data, destination_photographs, destination_ios, destination_schema,
+                  destination_binary=None):
         """
         Serialize RDF graphs
 
         :param destination_data: serialization destination for data
         :param destination_photographs: serialization destination for photo data
         :param destination_schema: serialization destination for schema
+        :param destination_binary: directory for a binary copy of all graphs (see rdf_binary.py), not written if None
         :return: output from rdflib.Graph.serialize
         """
+        self.bind_prefixes()
+
+        data = self.data.serialize(format="turtle", destination=destination_data)
+        photographs = self.photographs.serialize(format="turtle", destination=destination_photographs)
+        information_objects = self.information_objects.serialize(format="turtle", destination=destination_ios)
+        schema = self.schema.serialize(format="turtle", destination=destination_schema)
+
+        self.log.info('Data serialized to %s' % destination_data)
+        self.log.info('Photo data serialized to %s' % destination_photographs)
+        self.log.info('Information object data serialized to %s' % destination_ios)
+        self.log.info('Schema serialized to %s' % destination_schema)
+
+        if destination_binary:
+            write_binary(self.named_graphs(), destination_binary)
+            self.log.info('Binary RDF serialized to %s' % destination_binary)
+
+        return data, photographs, information_objects, schema  # Return for testing purposes
+
+    def named_graphs(self):
+        """
+        :return: dict of dataset name -> graph
+        """
+        return {'cemeteries': self.data,
+                'cemetery_photos_and_photography_events': self.photographs,
+                'cemetery-photo-media': self.information_objects,
+                'cemeteries-schema': self.schema}
+
+    def serialize_quads(self, destination, format='nquads'):
+        """
+        Serialize all graphs into a single N-Quads or TriG file with a named graph per dataset. The sources of each
+        dataset are stated once in the default graph.
+
+        :param destination: serialization destination
+        :param format: 'nquads' or 'trig'
+        """
+        provenance = []
+
+        with open(destination, 'w', encoding='UTF-8') as f:
+            for name, graph in self.named_graphs().items():
+                graph_uri = GRAPHS_NS[name].n3()
+                # written triple by triple, without serializing the whole graph into a string first
+                if format == 'trig':
+                    f.write('%s {\n' % graph_uri)
+                    f.writelines('    %s\n' % canonical_line(triple) for triple in graph)
+                    f.write('}\n\n')
+                else:
+                    # N-Triples lines end with ' .'
+                    f.writelines('%s%s .\n' % (canonical_line(triple)[:-1], graph_uri) for triple in graph)
+
+                provenance += ['%s %s %s .\n' % (graph_uri, DC.source.n3(), source.n3())
+                               for source in sorted(set(graph.objects(None, DC.source)))]
+
+            f.writelines(provenance)
+
+        self.log.info('Named graphs serialized to %s' % destination)
+
+    def bind_prefixes(self):
         self.data.bind("temp-cemetery", "http://ldf.fi/warsa/temp/")
         self.data.bind("skos", "http://www.w3.org/2004/02/skos/core#")
         self.data.bind("crm", 'http://www.cidoc-crm.org/cidoc-crm/')
@@ -297,6 +623,7 @@ class RDFMapper:
         self.data.bind("wce", 'http://ldf.fi/warsa/places/cemeteries/')
         self.data.bind("wso", "http://ldf.fi/warsa/sources/")
         self.data.bind("dc-terms", "http://purl.org/dc/terms/")
+        self.data.bind("wev", "http://ldf.fi/warsa/events/")
 
         self.photographs.bind("crm", 'http://www.cidoc-crm.org/cidoc-crm/')
         self.photographs.bind("schema", 'http://schema.org/')
@@ -306,6 +633,8 @@ class RDFMapper:
         self.photographs.bind("wph", "http://ldf.fi/warsa/photographs/")
         self.photographs.bind("wev", "http://ldf.fi/warsa/events/")
         self.photographs.bind("wso", "http://ldf.fi/warsa/sources/")
+        self.photographs.bind("wac", "http://ldf.fi/warsa/actors/")
+        self.photographs.bind("skos", "http://www.w3.org/2004/02/skos/core#")
 
         self.information_objects.bind("skos", "http://www.w3.org/2004/02/skos/core#")
         self.information_objects.bind("cidoc", 'http://www.cidoc-crm.org/cidoc-crm/')
@@ -319,51 +648,143 @@ class RDFMapper:
         self.schema.bind("foaf", 'http://xmlns.com/foaf/0.1/')
         self.schema.bind("bioc", 'http://ldf.fi/schema/bioc/')
 
-        data = self.data.serialize(format="turtle", destination=destination_data)
-        photographs = self.photographs.serialize(format="turtle", destination=destination_photographs)
-        information_objects = self.information_objects.serialize(format="turtle", destination=destination_ios)
-        schema = self.schema.serialize(format="turtle", destination=destination_schema)
-
-        self.log.info('Data serialized to %s' % destination_data)
-        self.log.info('Photo data serialized to %s' % destination_photographs)
-        self.log.info('Information object data serialized to %s' % destination_ios)
-        self.log.info('Schema serialized to %s' % destination_schema)
+    def add_graphs(self, key, build):
+        """
+        Add the data, photograph and information object graphs of a row (or of another part of the conversion) to
+        the output graphs.
 
-        return data, photographs, information_objects, schema  # Return for testing purposes
+        With a row cache, graphs built on the previous run are reused if the key is unchanged, and the output graphs
+        are updated only with the difference between the runs in update_from_row_cache.
 
-    def process_rows(self):
+        :param key: hashable key identifying all input of the graphs
+        :param build: function returning a tuple of data, photograph and information object graphs
         """
-        Loop through CSV rows and convert them to RDF
+        if self.row_cache is None:
+            for graph, part in zip((self.data, self.photographs, self.information_objects), build()):
+                graph += part
+            self.rows_mapped += 1
+            return
+
+        if key in self.previous_row_cache:
+            graphs, photo_count = self.previous_row_cache[key]
+            self.photo_counter += photo_count
+        else:
+            photo_counter = self.photo_counter
+            graphs = build()
+            photo_count = self.photo_counter - photo_counter
+            self.rows_mapped += 1
+
+        self.row_cache[key] = (graphs, photo_count)
+
+    def update_from_row_cache(self):
         """
-        # column_headers = list(self.table)
-        #
-        for index in range(len(self.table)):
-
-
-
-            # convert to RDF
-            if self.table.ix[index]['tyyppi'] != 'ei_ole':
+        Update the output graphs of the previous run with the graphs of removed and added keys. Graphs of different
+        keys must not share triples.
 
-                # create an URI
-                names = split_cemetery_name(self.table.ix[index]['nykyiset_kunnat'])
-                photo_project_name = names['narc_name'].lower()
-                if photo_project_name in self.narc_names:
-                    cemetery_uri = URIRef(self.narc_names[photo_project_name][0])
-                    del self.narc_names[photo_project_name]
-                    self.cemeteries_found_in_warsampo += 1
-                else:
-                    # create new URIs for cemeteries that are not already in WarSampo
-                    local_name = 'h0' + str(self.new_cemetery_id) + '_1'
-                    self.new_cemetery_id += 1
-                    cemetery_uri = CEMETERY_DATA_NS[local_name]
-                    self.cemeteries_new_to_warsampo += 1
-                    #print(cemetery_uri)
-                    #print(photo_project_name)
+        :return: set of indexes of the changed output graphs (0: data, 1: photographs, 2: information objects)
+        """
+        changed = set()
+        outputs = (self.data, self.photographs, self.information_objects)
+        removed = [set() for graph in outputs]
+        added = [set() for graph in outputs]
+        for key in self.previous_row_cache.keys() - self.row_cache.keys():
+            for triples, part in zip(removed, self.previous_row_cache[key][0]):
+                triples.update(part)
+        for key in self.row_cache.keys() - self.previous_row_cache.keys():
+            for triples, part in zip(added, self.row_cache[key][0]):
+                triples.update(part)
+
+        for i, graph in enumerate(outputs):
+            # A changed row is both removed and added, its unchanged triples are left in place
+            for triple in removed[i] - added[i]:
+                graph.remove(triple)
+                changed.add(i)
+            for triple in added[i] - removed[i]:
+                graph.add(triple)
+                changed.add(i)
+        return changed
+
+    def map_row(self, cemetery_uri, row, resolved):
+        """
+        Map a row into the output graphs, reusing the previous result for an unchanged row with the same cemetery
+        URI and photographer actors if a row cache is in use.
+        """
+        def build():
+            row_photographs = Graph()
+            row_information_objects = Graph()
+            row_rdf = self.map_row_to_rdf(cemetery_uri, row, resolved, row_photographs, row_information_objects)
+            return row_rdf, row_photographs, row_information_objects
 
-                row_rdf = self.map_row_to_rdf(cemetery_uri, self.table.ix[index])
+        photographers = tuple(tuple(self.photographers.get(row[column_name], ()))
+                              for column_name in self.mapping if column_name.endswith('kuvaajan_nimi'))
+        self.add_graphs((cemetery_uri, tuple(row.values()), photographers), build)
 
-            if row_rdf:
-                self.data += row_rdf
+    def process_rows(self):
+        """
+        Loop through CSV rows and convert them to RDF
+        """
+        if self.row_cache is not None:
+            self.previous_row_cache = self.row_cache
+            self.row_cache = {}
+
+        actor_rdf = self.create_photographer_instances()
+        self.add_graphs(('photographers', frozenset(actor_rdf)), lambda: (Graph(), actor_rdf, Graph()))
+
+        # Geocoding and photo file checks run on a thread pool ahead of the mapping, which stays on this thread
+        # because cemetery URIs are assigned in row order.
+        rows = self.table.to_dict('records')
+        # rows without a cemetery are skipped before resolution, so they are never geocoded
+        rows = (row for row in rows if row['tyyppi'] != 'ei_ole')
+        cemeteries = []
+        self.search_records = []
+        self.facets = FacetCounter()
+
+        for row, resolved in pipelined(rows, self.resolve_row, workers=self.workers):
+
+            # create an URI
+            names = split_cemetery_name(row['nykyiset_kunnat'])
+            photo_project_name = names['narc_name'].lower()
+            if photo_project_name in self.narc_names:
+                cemetery_uri = URIRef(self.narc_names[photo_project_name][0])
+                del self.narc_names[photo_project_name]
+                self.cemeteries_found_in_warsampo += 1
+            else:
+                # create new URIs for cemeteries that are not already in WarSampo
+                local_name = 'h0' + str(self.new_cemetery_id) + '_1'
+                self.new_cemetery_id += 1
+                cemetery_uri = CEMETERY_DATA_NS[local_name]
+                self.cemeteries_new_to_warsampo += 1
+                #print(cemetery_uri)
+                #print(photo_project_name)
+
+            # check if photo files exist
+            self.missing_filenames += resolved['missing_files']
+
+            self.map_row(cemetery_uri, row, resolved)
+
+            official_name = row['hautausmaan_nimi']
+            cemeteries.append((cemetery_uri, official_name if official_name not in EMPTY_VALUES else names['narc_name'],
+                               resolved['values']))
+
+            # plain values for the search documents, see search_documents.py
+            self.search_records.append({
+                'uri': str(cemetery_uri),
+                'labels': cemetery_labels(names, official_name),
+                'values': resolved['values'],
+                'photos': [(column_name, value) for column_name, value in resolved['values'].items()
+                           if column_name.startswith('kuva_') and not column_name.endswith('kuvaajan_nimi')]})
+
+            facet_values = {'current_municipality': names['current_municipality']}
+            for facet, column_name in (('camera_club', 'kuvaukset_toteuttanut_kameraseura'), ('area', 'alue'),
+                                       ('cemetery_type', 'tyyppi')):
+                facet_values[facet] = resolved['values'].get(column_name)
+            graves = resolved['values'].get('hautoja')
+            self.facets.add(facet_values, {'graves_per_municipality': graves if isinstance(graves, int) else None})
+
+        event_columns = [column_name for column_name, mapping in self.mapping.items() if 'event_type' in mapping]
+        events_key = tuple((uri, name, tuple(values.get(column_name) for column_name in event_columns))
+                           for uri, name, values in cemeteries)
+        self.add_graphs(('events', events_key), lambda: (self.create_cemetery_events(cemeteries), Graph(), Graph()))
 
         for filename in self.missing_filenames:
             self.log.warning('missing file: %s' % filename)
@@ -373,7 +794,10 @@ class RDFMapper:
         # Generate simple cemeteries with no metadata from the leftover
         # cemeteries that were not found in the photography project
         self.cemeteries_in_warsampo_not_project = len(self.narc_names.keys())
-        self.data += self.create_extra_cemeteries(self.narc_names)
+        self.add_graphs(('extra_cemeteries', frozenset(self.narc_names.items())),
+                        lambda: (self.create_extra_cemeteries(self.narc_names), Graph(), Graph()))
+        if self.row_cache is not None:
+            self.changed_outputs = self.update_from_row_cache()
 
         total_found = self.cemeteries_found_in_warsampo + self.cemeteries_new_to_warsampo
 
@@ -405,27 +829,347 @@ class RDFMapper:
                                  Literal(prop['former_municipality_name_fi'], lang='fi')))
                 self.schema.add((prop['former_municipality_uri'], SKOS.prefLabel,
                                  Literal(prop['former_municipality_name_en'], lang='en')))
+
+                if self.municipalities:
+                    for link in ('current_municipality_link', 'former_municipality_link'):
+                        self.schema.add((prop[link + '_uri'], RDF.type, RDF.Property))
+                        self.schema.add((prop[link + '_uri'], SKOS.prefLabel,
+                                         Literal(prop[link + '_name_fi'], lang='fi')))
+                        self.schema.add((prop[link + '_uri'], SKOS.prefLabel,
+                                         Literal(prop[link + '_name_en'], lang='en')))
             else:
                 continue
 
+        self.schema += facet_schema()
+
+def convert_cemeteries(csv_input, output_dir, loglevel='INFO', workers=8, snapshot_dir=None, narc_names=None,
+                       photo_index=None, municipalities=None, binary=False, documents=False, facets=False,
+                       quads=None, document_workers=1):
+    """
+    Convert a cemetery CSV file and serialize the RDF files into output_dir
+
+    :param csv_input: input CSV file
+    :param output_dir: output directory, ending with '/'
+    :param narc_names: NARC cemetery index shared between conversions, read from CSV if not given
+    :param photo_index: photo index shared between conversions, photo files are checked one by one if not given
+    :param municipalities: municipality gazetteer index, municipalities are not linked if not given
+    :param binary: also write the graphs in the binary format into output_dir/cemeteries.rdfbin/
+    :param documents: also write search documents for bulk loading into output_dir/cemeteries.ndjson
+    :param document_workers: number of processes for the search documents, used only for large inputs
+    :param facets: also write precomputed facet counts into output_dir/cemetery-facets.ttl and
+                   output_dir/cemetery-facets.json
+    :param quads: 'nquads' or 'trig' to write all graphs into a single file (cemeteries.nq or cemeteries.trig)
+                  instead of the Turtle files
+    :return: RDFMapper instance holding the converted graphs
+    """
+    mapper = RDFMapper(CEMETERY_MAPPING, WARSA_SCHEMA_NS['Cemetery'], loglevel=loglevel, workers=workers)
+    mapper.read_narc_cemetery_uris_from_csv(narc_names)
+    mapper.photo_index = photo_index
+    mapper.municipalities = municipalities or {}
+    mapper.read_csv(csv_input, snapshot_dir=snapshot_dir)
+    mapper.process_rows()
+    if quads:
+        mapper.serialize_quads(output_dir + QUAD_FILENAMES[quads], format=quads)
+        if binary:
+            write_binary(mapper.named_graphs(), output_dir + 'cemeteries.rdfbin')
+            mapper.log.info('Binary RDF serialized to %scemeteries.rdfbin' % output_dir)
+    else:
+        serialize_outputs(mapper, output_dir, binary=binary)
+    if documents:
+        write_documents(mapper.search_records, output_dir + 'cemeteries.ndjson', PHOTO_URL, workers=document_workers)
+        mapper.log.info('Search documents written to %scemeteries.ndjson' % output_dir)
+    if facets:
+        mapper.facets.write(output_dir + 'cemetery-facets.ttl', output_dir + 'cemetery-facets.json')
+        mapper.log.info('Facets written to %scemetery-facets.ttl and %scemetery-facets.json' % (output_dir, output_dir))
+    return mapper
+
+
+def serialize_outputs(mapper, output_dir, atomic=False, outputs=None, binary=False):
+    """
+    Serialize the RDF files of a conversion into output_dir
+
+    :param mapper: RDFMapper holding the converted graphs
+    :param output_dir: output directory, ending with '/'
+    :param atomic: write into temporary files first and replace the output files only when all are written
+    :param outputs: indexes of the files to write (0: data, 1: photographs, 2: information objects, 3: schema),
+                    all files if not given
+    :param binary: also write the binary format when all files are written
+    """
+    filenames = ["cemeteries.ttl", "cemetery_photos_and_photography_events.ttl", "cemetery-photo-media.ttl",
+                 "cemeteries-schema.ttl"]
+    tmp_suffix = '.%s.tmp' % os.getpid() if atomic else ''
+    destinations = [output_dir + filename + tmp_suffix for filename in filenames]
+
+    if outputs is None:
+        outputs = range(len(filenames))
+        mapper.serialize(*destinations, destination_binary=output_dir + 'cemeteries.rdfbin' if binary else None)
+    else:
+        mapper.bind_prefixes()
+        graphs = (mapper.data, mapper.photographs, mapper.information_objects, mapper.schema)
+        for i in outputs:
+            graphs[i].serialize(format="turtle", destination=destinations[i])
+            mapper.log.info('Serialized %s' % destinations[i])
+
+    if atomic:
+        for i in outputs:
+            os.replace(destinations[i], output_dir + filenames[i])
+
+
+def watch(csv_input, output_dir, loglevel='INFO', workers=8, municipalities=None, interval=0.5):
+    """
+    Convert the input CSV again whenever it or the photo directories change. The NARC index, photo index, geocoding
+    cache and mapped rows are kept in memory, so only changed rows are mapped again. Output files are replaced
+    atomically.
+
+    The turnaround is not sub-second for every edit. With the 2017-12-29 data, a poll where nothing changed costs
+    about 0.4 s. An edit to a cemetery row takes about 1.2 s, most of it to re-serialize cemeteries.ttl. A changed
+    photographer takes about 2 s, because the photographs file is larger. The first conversion takes about 10 s.
+
+    :param csv_input: input CSV file
+    :param output_dir: output directory, ending with '/'
+    :param interval: polling interval in seconds
+    """
+    log = logging.getLogger(__name__)
+    narc_mapper = RDFMapper(CEMETERY_MAPPING, WARSA_SCHEMA_NS['Cemetery'], loglevel=loglevel)
+    narc_mapper.read_narc_cemetery_uris_from_csv()
+    photo_dirs = [os.path.join(PHOTO_DIR, size) for size in PHOTO_SIZES]
+
+    def modification_times(paths):
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+
+    photo_state = None
+    csv_state = None
+    photo_index = None
+    previous = None
+    # indexes of the output files not yet written with the current graphs, None for all files
+    unwritten = None
+
+    while True:
+        new_photo_state = modification_times(photo_dirs)
+        new_csv_state = modification_times([csv_input])
+
+        if new_photo_state != photo_state or new_csv_state != csv_state:
+            start = time.perf_counter()
+            # The states are updated only after a successful run, so a failed run (e.g. reading a CSV file that is
+            # being saved) is tried again on the next poll.
+            try:
+                new_photo_index = read_photo_index() if new_photo_state != photo_state else photo_index
+
+                mapper = RDFMapper(CEMETERY_MAPPING, WARSA_SCHEMA_NS['Cemetery'], loglevel=loglevel,
+                                   workers=workers)
+                mapper.read_narc_cemetery_uris_from_csv(narc_mapper.narc_names)
+                mapper.photo_index = new_photo_index
+                mapper.municipalities = municipalities or {}
+                if previous:
+                    # Continue from the graphs of the previous run, only the changes are applied to them
+                    mapper.row_cache = previous.row_cache
+                    mapper.data, mapper.photographs, mapper.information_objects = (
+                        previous.data, previous.photographs, previous.information_objects)
+                else:
+                    mapper.row_cache = {}
+                mapper.read_csv(csv_input)
+                mapper.process_rows()
+            except Exception:
+                log.exception('Converting %s failed, trying again on the next poll' % csv_input)
+                time.sleep(interval)
+                continue
+
+            if previous is None:
+                unwritten = None
+            elif unwritten is not None:
+                unwritten |= mapper.changed_outputs
+            previous = mapper
+
+            try:
+                serialize_outputs(mapper, output_dir, atomic=True,
+                                  outputs=sorted(unwritten) if unwritten is not None else None)
+            except Exception:
+                log.exception('Writing the output files failed, trying again on the next poll')
+                time.sleep(interval)
+                continue
+
+            log.info('%s rows mapped, %s output files written in %.3f s' % (
+                mapper.rows_mapped, len(unwritten) if unwritten is not None else 4, time.perf_counter() - start))
+            unwritten = set()
+            photo_state, csv_state, photo_index = new_photo_state, new_csv_state, new_photo_index
+
+        time.sleep(interval)
+
+
+def write_changelog(snapshot_graphs, destination):
+    """
+    Write a changelog of cemeteries added, removed and changed between consecutive snapshots
+
+    :param snapshot_graphs: list of (snapshot name, data graph) tuples in chronological order
+    :param destination: changelog filename
+    """
+    with open(destination, 'w', encoding='UTF-8') as f:
+        for (old_name, old_graph), (new_name, new_graph) in zip(snapshot_graphs, snapshot_graphs[1:]):
+            old_triples = set(old_graph)
+            new_triples = set(new_graph)
+            added = defaultdict(int)
+            removed = defaultdict(int)
+            for (s, p, o) in new_triples - old_triples:
+                added[s] += 1
+            for (s, p, o) in old_triples - new_triples:
+                removed[s] += 1
+
+            old_subjects = set(old_graph.subjects())
+            new_subjects = set(new_graph.subjects())
+
+            f.write('%s -> %s\n' % (old_name, new_name))
+            for subject in sorted(set(added) | set(removed)):
+                if subject not in old_subjects:
+                    f.write('  added: %s\n' % subject)
+                elif subject not in new_subjects:
+                    f.write('  removed: %s\n' % subject)
+                else:
+                    f.write('  changed: %s (+%s -%s)\n' % (subject, added[subject], removed[subject]))
+
+
+def snapshot_files(csv_inputs):
+    """
+    List the snapshot files of a batch conversion in chronological order. Snapshot file names start with their date,
+    so they are sorted by file name.
+
+    :param csv_inputs: list of CSV files or glob patterns
+    :return: list of absolute filenames
+    """
+    snapshots = set(os.path.abspath(filename)
+                    for pattern in csv_inputs for filename in (glob.glob(pattern) or [pattern]))
+    snapshots = sorted(snapshots, key=lambda filename: (Path(filename).name, filename))
+
+    # each snapshot is written into a directory named after the file
+    stems = defaultdict(list)
+    for filename in snapshots:
+        stems[Path(filename).stem].append(filename)
+    for stem, filenames in stems.items():
+        if len(filenames) > 1:
+            raise ValueError('Snapshots %s have the same name %s' % (', '.join(filenames), stem))
+
+    return snapshots
+
+
+def convert_batch(csv_inputs, output_dir, loglevel='INFO', workers=8, snapshot_dir=None, parallel=4,
+                  changelog=False, municipalities=None, binary=False, documents=False,
+                  facets=False, quads=None):
+    """
+    Convert several dated CSV snapshots in one process. The NARC index, photo index, geocoding cache and mapping
+    are shared between the conversions. Each snapshot is serialized into its own subdirectory of output_dir, named
+    after the snapshot file, so snapshot file names must be unique.
+
+    The snapshots are converted on threads so that they can share the geocoding cache. The threads overlap only
+    I/O (geocoding requests, photo file checks, file writes). The mapping itself is Python code that holds the GIL,
+    so it is not run in parallel.
+
+    :param csv_inputs: list of CSV files or glob patterns
+    :param output_dir: output directory, ending with '/'
+    :param parallel: number of snapshots converted concurrently
+    :param changelog: write a changelog between consecutive snapshots into output_dir
+    :param municipalities: municipality gazetteer index
+    :param binary: also write the graphs in the binary format
+    :param documents: also write search documents for bulk loading
+    :param facets: also write precomputed facet counts
+    :param quads: write a single N-Quads ('nquads') or TriG ('trig') file instead of the Turtle files
+    """
+    snapshots = snapshot_files(csv_inputs)
+
+    narc_mapper = RDFMapper(CEMETERY_MAPPING, WARSA_SCHEMA_NS['Cemetery'], loglevel=loglevel)
+    narc_mapper.read_narc_cemetery_uris_from_csv()
+    photo_index = read_photo_index()
+
+    def convert_snapshot(csv_input):
+        snapshot_output = output_dir + Path(csv_input).stem + '/'
+        os.makedirs(snapshot_output, exist_ok=True)
+        mapper = convert_cemeteries(csv_input, snapshot_output, loglevel=loglevel, workers=workers,
+                                    snapshot_dir=snapshot_dir, narc_names=narc_mapper.narc_names,
+                                    photo_index=photo_index, municipalities=municipalities, binary=binary,
+                                    documents=documents, facets=facets, quads=quads)
+        return Path(csv_input).stem, mapper.data
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        snapshot_graphs = list(executor.map(convert_snapshot, snapshots))
+
+    if changelog:
+        write_changelog(snapshot_graphs, output_dir + 'changelog.txt')
+
+
 if __name__ == "__main__":
 
     argparser = argparse.ArgumentParser(description="Process cemeteries CSV", fromfile_prefix_chars='@')
 
-    argparser.add_argument("input", help="Input CSV file")
+    argparser.add_argument("input", nargs='+',
+                           help="Input CSV file. In BATCH mode a list of CSV snapshots or glob patterns. In CHECK_URLS "
+                                "mode the generated media graph (cemetery-photo-media.ttl).")
     argparser.add_argument("output", help="Output location to serialize RDF files to")
-    argparser.add_argument("mode", help="CSV conversion mode", default="CEMETERIES", choices=["CEMETERIES"])
+    argparser.add_argument("mode", help="CSV conversion mode", default="CEMETERIES", choices=["CEMETERIES", "BATCH", "SERVE", "WATCH", "CHECK_URLS"])
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--workers", default=8, type=int,
+                           help="Number of threads for geocoding and photo file checks, default is 8.")
+    argparser.add_argument("--parallel", default=4, type=int,
+                           help="Number of snapshots converted concurrently in BATCH mode, default is 4. The threads "
+                                "only overlap I/O such as geocoding requests.")
+    argparser.add_argument("--changelog", action='store_true',
+                           help="Write a changelog between consecutive snapshots in BATCH mode.")
+    argparser.add_argument("--municipalities", default=None,
+                           help="Municipality gazetteer CSV (uri,label,aliases) for linking current and former "
+                                "municipalities")
+    argparser.add_argument("--binary", action='store_true',
+                           help="Also write the graphs in a memory-mappable binary format (cemeteries.rdfbin)")
+    argparser.add_argument("--ndjson", action='store_true',
+                           help="Also write per-cemetery search documents as NDJSON for bulk loading "
+                                "(cemeteries.ndjson)")
+    argparser.add_argument("--document-workers", default=1, type=int,
+                           help="Number of processes for writing search documents of large inputs, default is 1. "
+                                "Not used in BATCH mode.")
+    argparser.add_argument("--facets", action='store_true',
+                           help="Also write precomputed facet counts (cemetery-facets.ttl, cemetery-facets.json)")
+    argparser.add_argument("--quads", default=None, choices=sorted(QUAD_FILENAMES),
+                           help="Write all graphs into a single file with a named graph per dataset instead of the "
+                                "Turtle files")
+    argparser.add_argument("--interval", default=0.5, type=float,
+                           help="Polling interval in seconds in WATCH mode, default is 0.5.")
+    argparser.add_argument("--host", default='localhost', help="Host to listen on in SERVE mode, default is localhost.")
+    argparser.add_argument("--port", default=8080, type=int, help="Port to listen on in SERVE mode, default is 8080.")
+    argparser.add_argument("--base-url", default=None,
+                           help="Base URL to check photo URLs against in CHECK_URLS mode instead of %s" % PHOTO_URL)
+    argparser.add_argument("--rate", default=10, type=float,
+                           help="Maximum requests per second to a host in CHECK_URLS mode, default is 10.")
+    argparser.add_argument("--snapshot-dir", default='.snapshots',
+                           help="Directory for typed snapshots of input CSV files, default is .snapshots. "
+                                "Use an empty value to disable snapshots.")
 
     args = argparser.parse_args()
 
     output_dir = args.output + '/' if args.output[-1] != '/' else args.output
-
-    if args.mode == "CEMETERIES":
-        mapper = RDFMapper(CEMETERY_MAPPING, WARSA_SCHEMA_NS['Cemetery'], loglevel=args.loglevel.upper())
-        mapper.read_narc_cemetery_uris_from_csv()
-        mapper.read_csv(args.input)
-        mapper.process_rows()
-        mapper.serialize(output_dir + "cemeteries.ttl", output_dir + "cemetery_photos_and_photography_events.ttl",
-                         output_dir + "cemetery-photo-media.ttl", output_dir + "cemeteries-schema.ttl")
+    municipalities = read_municipality_index(args.municipalities) if args.municipalities else None
+
+    if args.mode in ("CEMETERIES", "SERVE"):
+        if len(args.input) != 1:
+            argparser.error('%s mode takes a single input file' % args.mode)
+        mapper = convert_cemeteries(args.input[0], output_dir, loglevel=args.loglevel.upper(), workers=args.workers,
+                                    snapshot_dir=args.snapshot_dir, municipalities=municipalities,
+                                    binary=args.binary, documents=args.ndjson, facets=args.facets,
+                                    quads=args.quads, document_workers=args.document_workers)
+        if args.mode == "SERVE":
+            LookupService(CemeteryIndex.from_mapper(mapper)).serve(args.host, args.port)
+    elif args.mode == "BATCH":
+        convert_batch(args.input, output_dir, loglevel=args.loglevel.upper(), workers=args.workers,
+                      snapshot_dir=args.snapshot_dir, parallel=args.parallel, changelog=args.changelog,
+                      municipalities=municipalities, binary=args.binary, documents=args.ndjson,
+                      facets=args.facets, quads=args.quads)
+    elif args.mode == "WATCH":
+        if len(args.input) != 1:
+            argparser.error('WATCH mode takes a single input file')
+        watch(args.input[0], output_dir, loglevel=args.loglevel.upper(), workers=args.workers,
+              municipalities=municipalities, interval=args.interval)
+    elif args.mode == "CHECK_URLS":
+        if len(args.input) != 1:
+            argparser.error('CHECK_URLS mode takes a single media graph file')
+        logging.basicConfig(level=getattr(logging, args.loglevel.upper()),
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        base_url = args.base_url + '/' if args.base_url and args.base_url[-1] != '/' else args.base_url
+        broken = check_urls(args.input[0], PHOTO_URL, base_url=base_url, workers=args.workers, rate=args.rate,
+                            cache_file=output_dir + 'url-check-cache.json')
+        sys.exit(1 if broken else 0)
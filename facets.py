@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Facet counts and aggregates of converted cemeteries, precomputed for the portal
+"""
+
+import json
+from collections import Counter, defaultdict
+
+from rdflib import Graph, Literal
+
+from converters import cached_slugify
+from namespaces import *
+
+# facet name -> property of the faceted value
+FACET_PROPERTIES = {
+    'current_municipality': CEMETERY_SCHEMA_NS.current_municipality,
+    'camera_club': CEMETERY_SCHEMA_NS.camera_club,
+    'area': CEMETERY_SCHEMA_NS.area,
+    'cemetery_type': CEMETERY_SCHEMA_NS.cemetery_type,
+}
+
+# aggregate name -> (facet the aggregate is grouped by, property of the aggregate value)
+AGGREGATE_PROPERTIES = {
+    'graves_per_municipality': ('current_municipality', CEMETERY_SCHEMA_NS.number_of_graves),
+}
+
+
+# vocabulary of the facet dataset: (URI, type, Finnish label, English label)
+FACET_SCHEMA = [
+    (CEMETERY_SCHEMA_NS.FacetValue, RDFS.Class, 'Fasetin arvo', 'Facet value'),
+    (CEMETERY_SCHEMA_NS.facet_property, RDF.Property, 'Fasetin ominaisuus', 'Facet property'),
+    (CEMETERY_SCHEMA_NS.number_of_cemeteries, RDF.Property, 'Hautausmaiden lukumäärä', 'Number of cemeteries'),
+]
+
+
+def facet_schema():
+    """
+    Schema of the facet dataset vocabulary
+
+    :return: rdflib Graph
+    """
+    schema = Graph()
+    for uri, rdf_type, name_fi, name_en in FACET_SCHEMA:
+        schema.add((uri, RDF.type, rdf_type))
+        schema.add((uri, SKOS.prefLabel, Literal(name_fi, lang='fi')))
+        schema.add((uri, SKOS.prefLabel, Literal(name_en, lang='en')))
+    return schema
+
+
+class FacetCounter:
+    """
+    Count cemeteries per facet value and sum aggregates over the groups of a facet in a single pass over the rows.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(Counter)
+        self.aggregates = defaultdict(Counter)
+
+    def add(self, values, aggregates=None):
+        """
+        Add a cemetery
+
+        :param values: dict of facet name -> value, None values are not counted. Values are typed as in the data,
+                       e.g. area is an integer.
+        :param aggregates: dict of aggregate name -> number added to the group of the cemetery
+        """
+        for facet, value in values.items():
+            if value is not None:
+                self.counts[facet][value] += 1
+
+        for name, number in (aggregates or {}).items():
+            group = values.get(AGGREGATE_PROPERTIES[name][0])
+            if group is not None and number is not None:
+                self.aggregates[name][group] += number
+
+    def lookup(self):
+        """
+        Facets as a plain lookup structure, values in descending order of count
+
+        :return: dict with 'facets' and 'aggregates', both dicts of name -> {value: number}
+        """
+        return {'facets': {facet: dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+                           for facet, counts in sorted(self.counts.items())},
+                'aggregates': {name: dict(sorted(aggregate.items()))
+                               for name, aggregate in sorted(self.aggregates.items())}}
+
+    def graph(self):
+        """
+        Facets as RDF. Each facet value is a resource with the faceted property, the value, the number of
+        cemeteries and the aggregates of its group.
+
+        :return: rdflib Graph
+        """
+        graph = Graph()
+        uris = {}
+
+        for facet, counts in self.counts.items():
+            used = set()
+            for value, count in sorted(counts.items()):
+                # values differing only in case or punctuation get numbered URIs
+                local_name = base_name = 'facet_%s_%s' % (facet, cached_slugify(str(value)))
+                suffix = 1
+                while local_name in used:
+                    suffix += 1
+                    local_name = '%s_%s' % (base_name, suffix)
+                used.add(local_name)
+                uri = CEMETERY_DATA_NS[local_name]
+                uris[facet, value] = uri
+                graph.add((uri, RDF.type, CEMETERY_SCHEMA_NS.FacetValue))
+                graph.add((uri, CEMETERY_SCHEMA_NS.facet_property, FACET_PROPERTIES[facet]))
+                graph.add((uri, RDF.value, Literal(value)))
+                graph.add((uri, CEMETERY_SCHEMA_NS.number_of_cemeteries, Literal(count, datatype=XSD.integer)))
+
+        for name, aggregate in self.aggregates.items():
+            facet, prop = AGGREGATE_PROPERTIES[name]
+            for group, number in aggregate.items():
+                graph.add((uris[facet, group], prop, Literal(number, datatype=XSD.integer)))
+
+        return graph
+
+    def write(self, destination_rdf, destination_lookup):
+        """
+        Serialize the facets as Turtle and the lookup structure as JSON
+        """
+        graph = self.graph()
+        graph.bind('wces', CEMETERY_SCHEMA_NS)
+        graph.bind('wce', CEMETERY_DATA_NS)
+        graph.serialize(format='turtle', destination=destination_rdf)
+
+        with open(destination_lookup, 'w', encoding='UTF-8') as f:
+            json.dump(self.lookup(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Indexed lookups over converted cemetery data, served as JSON-LD over HTTP
+"""
+
+import argparse
+import bisect
+import functools
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from rdflib import Graph, Literal, URIRef
+
+from namespaces import *
+
+log = logging.getLogger(__name__)
+
+JSONLD_CONTEXT = {
+    'prefLabel': str(SKOS.prefLabel),
+    'altLabel': str(SKOS.altLabel),
+    'cemeteryId': str(CEMETERY_SCHEMA_NS.cemetery_id),
+    'cemeteryType': str(CEMETERY_SCHEMA_NS.cemetery_type),
+    'currentMunicipality': str(CEMETERY_SCHEMA_NS.current_municipality),
+    'formerMunicipality': str(CEMETERY_SCHEMA_NS.former_municipality),
+    'address': str(CEMETERY_SCHEMA_NS.address),
+    'numberOfGraves': str(CEMETERY_SCHEMA_NS.number_of_graves),
+    'memorial': str(CEMETERY_SCHEMA_NS.memorial),
+    'lat': str(WGS84.lat),
+    'long': str(WGS84.long),
+    'description': {'@id': str(DC.description), '@container': '@language'},
+    'contentUrl': str(SCHEMA_ORG.contentUrl),
+}
+
+DOCUMENT_PROPERTIES = {URIRef(uri if isinstance(uri, str) else uri['@id']): name
+                       for name, uri in JSONLD_CONTEXT.items()}
+
+
+def normalize_key(value):
+    """
+    Normalize a lookup key: case-insensitive, surrounding and repeated whitespace ignored
+    """
+    return ' '.join(str(value).split()).casefold()
+
+
+def normalize_id(value):
+    """
+    Normalize a cemetery identifier to the three digit form used in the data, e.g. '1' -> '001'
+    """
+    value = str(value).strip()
+    return format(int(value), '03d') if value.isdigit() else value
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class CemeteryIndex:
+    """
+    Hash indexes on cemetery identifier, municipality and label, and a prefix index for label autocompletion.
+    """
+
+    def __init__(self, data, photographs, information_objects):
+        self.documents = {}
+        self.by_id = {}
+        self.by_municipality = defaultdict(list)
+        self.by_label = defaultdict(list)
+        self.photos = defaultdict(list)
+        self.labels = []
+
+        for cemetery in set(data.subjects(RDF.type, WARSA_SCHEMA_NS.Cemetery)):
+            doc = {'@id': str(cemetery)}
+            for p, o in data.predicate_objects(cemetery):
+                name = DOCUMENT_PROPERTIES.get(p)
+                if name:
+                    doc[name] = o.toPython() if isinstance(o, Literal) else str(o)
+            self.documents[cemetery] = doc
+
+            if 'cemeteryId' in doc:
+                self.by_id[normalize_id(doc['cemeteryId'])] = cemetery
+            for name in ('currentMunicipality', 'formerMunicipality'):
+                if name in doc:
+                    self.by_municipality[normalize_key(doc[name])].append(cemetery)
+            for name in ('prefLabel', 'altLabel'):
+                if name in doc:
+                    key = normalize_key(doc[name])
+                    self.by_label[key].append(cemetery)
+                    self.labels.append((key, str(cemetery)))
+
+        self.labels.sort()
+
+        for photo, cemetery in photographs.subject_objects(CIDOC.P138_represents):
+            photo_doc = {'@id': str(photo), 'description': {}, 'contentUrl': []}
+            for description in photographs.objects(photo, DC.description):
+                photo_doc['description'][description.language] = str(description)
+            for media in photographs.objects(photo, CIDOC.P138i_has_representation):
+                photo_doc['contentUrl'] += [str(url) for url in information_objects.objects(media,
+                                                                                          SCHEMA_ORG.contentUrl)]
+            photo_doc['contentUrl'].sort()
+            self.photos[cemetery].append(photo_doc)
+
+        for photo_docs in self.photos.values():
+            photo_docs.sort(key=lambda photo_doc: photo_doc['@id'])
+
+        log.info('Indexed %s cemeteries' % len(self.documents))
+
+    @classmethod
+    def from_mapper(cls, mapper):
+        """
+        Build the index from the in-memory graphs of an RDFMapper
+        """
+        return cls(mapper.data, mapper.photographs, mapper.information_objects)
+
+    @classmethod
+    def from_directory(cls, output_dir):
+        """
+        Build the index from the Turtle files serialized by csv_to_rdf.py
+        """
+        output_dir = output_dir + '/' if output_dir[-1] != '/' else output_dir
+        data = Graph().parse(output_dir + 'cemeteries.ttl', format='turtle')
+        photographs = Graph().parse(output_dir + 'cemetery_photos_and_photography_events.ttl', format='turtle')
+        information_objects = Graph().parse(output_dir + 'cemetery-photo-media.ttl', format='turtle')
+        return cls(data, photographs, information_objects)
+
+    def _documents(self, uris):
+        return [self.documents[uri] for uri in sorted(set(uris))]
+
+    def cemetery_by_id(self, cemetery_id):
+        uri = self.by_id.get(normalize_id(cemetery_id))
+        return self._documents([uri] if uri else [])
+
+    def cemeteries_by_municipality(self, municipality):
+        return self._documents(self.by_municipality.get(normalize_key(municipality), []))
+
+    def cemeteries_by_label(self, label):
+        return self._documents(self.by_label.get(normalize_key(label), []))
+
+    def photos_by_id(self, cemetery_id):
+        uri = self.by_id.get(normalize_id(cemetery_id))
+        return list(self.photos.get(uri, [])) if uri else []
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        Find labels starting with prefix
+
+        :return: list of {'label', '@id'} dicts in label order
+        """
+        prefix = normalize_key(prefix)
+        results = []
+        found = set()
+        start = bisect.bisect_left(self.labels, (prefix,))
+        for key, uri in self.labels[start:]:
+            if not key.startswith(prefix) or len(results) >= limit:
+                break
+            if uri in found:
+                continue
+            found.add(uri)
+            label = self.documents[URIRef(uri)].get('prefLabel', key)
+            results.append({'@id': uri, 'label': label})
+        return results
+
+
+class LookupService:
+    """
+    JSON-LD lookup API over a CemeteryIndex with an LRU response cache and latency statistics.
+
+    Endpoints: /cemeteries?id=, /cemeteries?municipality=, /cemeteries?label=, /photos?id=, /autocomplete?q=,
+    /stats
+    """
+
+    def __init__(self, index, cache_size=1024, latency_window=10000):
+        self.index = index
+        self.latencies = deque(maxlen=latency_window)
+        self.lock = threading.Lock()
+        self.respond = functools.lru_cache(maxsize=cache_size)(self._respond)
+
+    def _respond(self, path, query):
+        """
+        Answer a query
+
+        :param path: request path
+        :param query: query string
+        :return: tuple of HTTP status and response body
+        """
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+
+        if path == '/cemeteries' and 'id' in params:
+            result = self.index.cemetery_by_id(params['id'])
+        elif path == '/cemeteries' and 'municipality' in params:
+            result = self.index.cemeteries_by_municipality(params['municipality'])
+        elif path == '/cemeteries' and 'label' in params:
+            result = self.index.cemeteries_by_label(params['label'])
+        elif path == '/photos' and 'id' in params:
+            result = self.index.photos_by_id(params['id'])
+        elif path == '/autocomplete' and 'q' in params:
+            limit = params.get('limit', '10')
+            if not limit.isdigit():
+                return 400, json.dumps({'error': 'limit must be a non-negative integer'}).encode('UTF-8')
+            result = self.index.autocomplete(params['q'], int(limit))
+        else:
+            return 404, json.dumps({'error': 'Unknown query'}).encode('UTF-8')
+
+        return 200, json.dumps({'@context': JSONLD_CONTEXT, '@graph': result}, ensure_ascii=False).encode('UTF-8')
+
+    def stats(self):
+        """
+        Latency percentiles in milliseconds and cache statistics
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        cache = self.respond.cache_info()
+        return {'requests': len(latencies),
+                'latency_ms': {'p50': percentile(latencies, 50),
+                               'p90': percentile(latencies, 90),
+                               'p99': percentile(latencies, 99)},
+                'cache': {'hits': cache.hits, 'misses': cache.misses, 'size': cache.currsize}}
+
+    def handle(self, url):
+        """
+        Handle a request URL and record its latency
+
+        :return: tuple of HTTP status and response body
+        """
+        start = time.perf_counter()
+        parts = urlsplit(url)
+        if parts.path == '/stats':
+            return 200, json.dumps(self.stats()).encode('UTF-8')
+
+        status, body = self.respond(parts.path, parts.query)
+        with self.lock:
+            self.latencies.append((time.perf_counter() - start) * 1000)
+        return status, body
+
+    def serve(self, host='localhost', port=8080):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status, body = service.handle(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/ld+json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        log.info('Serving cemetery lookups on %s:%s' % (host, port))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+
+    argparser = argparse.ArgumentParser(description="Serve lookups over converted cemetery data")
+
+    argparser.add_argument("input", help="Directory containing the RDF files serialized by csv_to_rdf.py")
+    argparser.add_argument("--host", default='localhost', help="Host to listen on, default is localhost.")
+    argparser.add_argument("--port", default=8080, type=int, help="Port to listen on, default is 8080.")
+    argparser.add_argument("--cache-size", default=1024, type=int, help="LRU response cache size, default is 1024.")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    LookupService(CemeteryIndex.from_directory(args.input), cache_size=args.cache_size).serve(args.host, args.port)
@@ -13,18 +13,28 @@ CEMETERY_MAPPING = {
     'tyyppi': {'uri': CEMETERY_SCHEMA_NS.cemetery_type,
                'name_fi': 'Hautausmaan tyyppi',
                'name_en': 'Cemetery type'},
+    'alue': {'uri': CEMETERY_SCHEMA_NS.area,
+             'converter': convert_int,
+             'name_fi': 'Alue',
+             'name_en': 'Area'},
     'nro': {'uri': CEMETERY_SCHEMA_NS.cemetery_id,
             'converter': add_trailing_zeros,
             'name_fi': 'Hautausmaan tunniste',
             'name_en': 'Cemetery identifier'},
     'nykyiset_kunnat': {'current_municipality_uri': CEMETERY_SCHEMA_NS.current_municipality,
                         'former_municipality_uri': CEMETERY_SCHEMA_NS.former_municipality,
+                        'current_municipality_link_uri': CEMETERY_SCHEMA_NS.located_in_current_municipality,
+                        'former_municipality_link_uri': CEMETERY_SCHEMA_NS.located_in_former_municipality,
                         'original_narc_name_uri': SKOS.altLabel,
                         'converter': split_cemetery_name,
                         'current_municipality_name_fi': 'Nykyinen kunta',
                         'former_municipality_name_fi': 'Entinen kunta',
                         'current_municipality_name_en': 'Current municipality',
-                        'former_municipality_name_en': 'Former municipality'},
+                        'former_municipality_name_en': 'Former municipality',
+                        'current_municipality_link_name_fi': 'Sijaintikunta',
+                        'former_municipality_link_name_fi': 'Sijaintikunta ennen kuntaliitosta',
+                        'current_municipality_link_name_en': 'Located in municipality',
+                        'former_municipality_link_name_en': 'Located in former municipality'},
     'kuvaukset_toteuttanut_kameraseura': {'uri': CEMETERY_SCHEMA_NS.camera_club,
                                           'name_fi': 'Kuvaukset toteuttanut kameraseura',
                                           'name_en': 'Camera club'},
@@ -39,11 +49,19 @@ CEMETERY_MAPPING = {
     'perustettu': {'uri': CEMETERY_SCHEMA_NS.date_of_foundation,
                    'converter': convert_dates,
                    'name_fi': 'Perustamisvuosi',
-                   'name_en': 'Date of foundation'},
+                   'name_en': 'Date of foundation',
+                   'event_type': CIDOC.E63_Beginning_of_Existence,
+                   'event_participant_uri': CIDOC.P92_brought_into_existence,
+                   'event_uri_prefix': 'cemetery_foundation_',
+                   'event_labels': ('Hautausmaan perustaminen: {name}', 'Foundation of cemetery: {name}')},
     'paljastettu': {'uri': CEMETERY_SCHEMA_NS.memorial_unveiling_date,
                    'converter': convert_dates,
                    'name_fi': 'Muistimerkin paljastamisaika',
-                   'name_en': 'Memorial unveiling date'},
+                   'name_en': 'Memorial unveiling date',
+                   'event_type': CIDOC.E7_Activity,
+                   'event_participant_uri': CIDOC.P12_occurred_in_the_presence_of,
+                   'event_uri_prefix': 'cemetery_memorial_unveiling_',
+                   'event_labels': ('Muistomerkin paljastaminen: {name}', 'Unveiling of memorial: {name}')},
     'nimi': {'uri': CEMETERY_SCHEMA_NS.memorial,
                    'name_fi': 'Muistomerkin nimi',
                    'name_en': 'Memorial'},
@@ -26,3 +26,5 @@ EVENTS_NS = Namespace('http://ldf.fi/warsa/events/')
 WARSA_PHOTOGRAPHS_NS = Namespace('http://ldf.fi/warsa/photographs/')
 WARSA_MEDIA_NS = Namespace('http://ldf.fi/warsa/media/')
 WARSA_SOURCE_NS = Namespace('http://ldf.fi/warsa/sources/')
+ACTORS_NS = Namespace('http://ldf.fi/warsa/actors/')
+GRAPHS_NS = Namespace('http://ldf.fi/warsa/graphs/')
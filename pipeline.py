@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Pipelined execution of conversion stages
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def pipelined(items, stage, workers=8, max_pending=32):
+    """
+    Run an I/O-bound stage for items on a thread pool while the caller consumes the results.
+
+    Items are read lazily and at most max_pending of them are in flight at a time, so the stage runs ahead of
+    the consumer only by a bounded amount. Results are yielded in input order.
+
+    :param items: iterable of input items
+    :param stage: function applied to each item
+    :param workers: number of worker threads
+    :param max_pending: maximum number of submitted items whose results have not been consumed yet
+    :return: generator of (item, stage result) tuples
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(stage, item)))
+            if len(pending) >= max_pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
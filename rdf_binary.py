@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Compact binary RDF output for fast reloading.
+
+A binary output directory contains a term dictionary shared by all graphs and one array of integer triples per
+graph:
+
+    terms.bin          N3 representations of all terms in sorted order, UTF-8 encoded and concatenated
+    term_offsets.npy   int64 start offsets of the terms in terms.bin, followed by the total length
+    <graph name>.npy   int32 array of shape (n, 3) with (subject, predicate, object) term ids, sorted
+
+All files are memory-mapped when loaded, so only the parts actually accessed are read from disk.
+"""
+
+import bisect
+import functools
+import os
+
+import numpy as np
+from rdflib import Graph
+from rdflib.util import from_n3
+
+TERMS_FILE = 'terms.bin'
+OFFSETS_FILE = 'term_offsets.npy'
+
+
+def write_binary(graphs, destination):
+    """
+    Write graphs in the binary format
+
+    :param graphs: dict of graph name -> rdflib Graph
+    :param destination: output directory
+    """
+    os.makedirs(destination, exist_ok=True)
+
+    terms = sorted(set(term.n3() for graph in graphs.values() for triple in graph for term in triple))
+    term_ids = {term: i for i, term in enumerate(terms)}
+
+    encoded = [term.encode('UTF-8') for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+
+    with open(os.path.join(destination, TERMS_FILE), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(destination, OFFSETS_FILE), offsets)
+
+    for name, graph in graphs.items():
+        triples = np.array([[term_ids[term.n3()] for term in triple] for triple in graph],
+                           dtype=np.int32).reshape(-1, 3)
+        triples = triples[np.lexsort((triples[:, 2], triples[:, 1], triples[:, 0]))]
+        np.save(os.path.join(destination, name + '.npy'), triples)
+
+
+def _cell(triples, position, row):
+    return triples[row, position]
+
+
+class _Keys:
+    """
+    Read-only sequence of key(0) ... key(length - 1) to binary search with bisect, which only takes a key function
+    from Python 3.10 on
+    """
+
+    def __init__(self, length, key):
+        self.length = length
+        self.key = key
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.key(i)
+
+
+class BinaryRDF:
+    """
+    Memory-mapped reader for the binary format written by write_binary.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode='r')
+        terms_path = os.path.join(directory, TERMS_FILE)
+        self.terms = np.memmap(terms_path, dtype=np.uint8, mode='r') if os.path.getsize(terms_path) else b''
+        self.graphs = {filename[:-4]: np.load(os.path.join(directory, filename), mmap_mode='r')
+                       for filename in sorted(os.listdir(directory))
+                       if filename.endswith('.npy') and filename != OFFSETS_FILE}
+
+    def __len__(self):
+        return sum(len(triples) for triples in self.graphs.values())
+
+    def n3(self, term_id):
+        """
+        N3 representation of a term id
+        """
+        return bytes(self.terms[self.offsets[term_id]:self.offsets[term_id + 1]]).decode('UTF-8')
+
+    def term(self, term_id):
+        """
+        rdflib term of a term id
+        """
+        return from_n3(self.n3(term_id))
+
+    def term_id(self, term):
+        """
+        Find the id of an rdflib term by binary search in the sorted dictionary
+
+        :return: term id or None if the term is not in the dictionary
+        """
+        n3 = term.n3()
+        i = bisect.bisect_left(_Keys(len(self.offsets) - 1, self.n3), n3)
+        return i if i < len(self.offsets) - 1 and self.n3(i) == n3 else None
+
+    def triples(self, name, pattern=(None, None, None)):
+        """
+        Match a triple pattern in a graph. A bound subject, and a bound predicate after it, are found by binary search
+        in the sorted triples, so only the matching rows are read. Other bound terms are matched by scanning the
+        remaining rows.
+
+        :param name: graph name
+        :param pattern: (subject, predicate, object) tuple of rdflib terms, None matches anything
+        :return: iterator of rdflib triples
+        """
+        term_ids = []
+        for term in pattern:
+            term_id = self.term_id(term) if term is not None else None
+            if term is not None and term_id is None:
+                return
+            term_ids.append(term_id)
+
+        triples = self.graphs[name]
+        # the triples are sorted by subject, predicate and object, so a leading run of bound terms is a contiguous
+        # range of rows. np.searchsorted would copy the strided column, so the search uses bisect on the rows.
+        bound = 0
+        while bound < 3 and term_ids[bound] is not None:
+            column = _Keys(len(triples), functools.partial(_cell, triples, bound))
+            triples = triples[bisect.bisect_left(column, term_ids[bound]):bisect.bisect_right(column, term_ids[bound])]
+            bound += 1
+
+        mask = np.ones(len(triples), dtype=bool)
+        for position in range(bound, 3):
+            if term_ids[position] is not None:
+                mask &= triples[:, position] == term_ids[position]
+
+        matched = triples[mask]
+        terms = {term_id: self.term(term_id) for term_id in np.unique(matched).tolist()}
+        for s, p, o in matched.tolist():
+            yield terms[s], terms[p], terms[o]
+
+    def graph(self, name):
+        """
+        Load a graph into an rdflib Graph
+        """
+        graph = Graph()
+        graph.addN(triple + (graph,) for triple in self.triples(name))
+        return graph
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Diff RDF graphs without blank nodes by comparing sorted canonical N-Triples.
+
+Both sides are sorted with an external merge sort. For N-Triples input, which is streamed, memory use is bounded by
+the sort chunk size. Other formats are parsed into memory before sorting, so memory use grows with the graph.
+"""
+
+import argparse
+import heapq
+import itertools
+import sys
+import tempfile
+
+from rdflib import Graph, Literal
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+from rdflib.util import guess_format
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+
+class _TripleSink:
+
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+
+def quote_literal(value):
+    """
+    N-Triples string of a literal's lexical form, with line breaks escaped to keep each triple on one line
+    """
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def canonical_line(triple):
+    """
+    Canonical N-Triples line of a triple, without the line break
+    """
+    s, p, o = triple
+    if isinstance(o, Literal):
+        obj = quote_literal(o)
+        if o.language:
+            obj += '@' + o.language
+        elif o.datatype:
+            obj += '^^' + o.datatype.n3()
+    else:
+        obj = o.n3()
+    return '%s %s %s .' % (s.n3(), p.n3(), obj)
+
+
+def ntriples_lines(source):
+    """
+    Read RDF as canonical N-Triples lines. N-Triples files are parsed and streamed line by line, other files are
+    parsed into an in-memory rdflib Graph first.
+
+    :param source: rdflib Graph or filename
+    :return: iterator of N-Triples lines without line breaks
+    """
+    if not isinstance(source, Graph):
+        if guess_format(source) == 'nt':
+            sink = _TripleSink()
+            parser = W3CNTriplesParser(sink)
+            with open(source, encoding='UTF-8') as f:
+                for line in f:
+                    parser.parsestring(line)
+                    for triple in sink.triples:
+                        yield canonical_line(triple)
+                    sink.triples.clear()
+            return
+        source = Graph().parse(source, format=guess_format(source))
+
+    for triple in source:
+        yield canonical_line(triple)
+
+
+def _write_run(lines, tmp_dir):
+    run = tempfile.TemporaryFile('w+', encoding='UTF-8', dir=tmp_dir)
+    run.writelines(line + '\n' for line in sorted(lines))
+    run.seek(0)
+    return run
+
+
+def external_sort(lines, chunk_size=DEFAULT_CHUNK_SIZE, tmp_dir=None):
+    """
+    Sort lines and remove duplicates, keeping at most chunk_size lines in memory at a time
+
+    :param lines: iterable of lines without line breaks
+    :param chunk_size: number of lines sorted in memory before writing a sorted run to a temporary file
+    :param tmp_dir: directory for the temporary files
+    :return: iterator of sorted unique lines
+    """
+    lines = iter(lines)
+    runs = []
+    try:
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            runs.append(_write_run(chunk, tmp_dir))
+
+        previous = None
+        for line in heapq.merge(*((line.rstrip('\n') for line in run) for run in runs)):
+            if line != previous:
+                yield line
+            previous = line
+    finally:
+        for run in runs:
+            run.close()
+
+
+def diff_sorted(old_lines, new_lines):
+    """
+    Compare two sorted iterators of unique lines
+
+    :return: iterator of ('-', line) for lines only in old_lines and ('+', line) for lines only in new_lines
+    """
+    old_lines = iter(old_lines)
+    new_lines = iter(new_lines)
+    old = next(old_lines, None)
+    new = next(new_lines, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            yield '-', old
+            old = next(old_lines, None)
+        elif old is None or new < old:
+            yield '+', new
+            new = next(new_lines, None)
+        else:
+            old = next(old_lines, None)
+            new = next(new_lines, None)
+
+
+def subject_of(line):
+    return line.split(' ', 1)[0]
+
+
+def diff(old, new, chunk_size=DEFAULT_CHUNK_SIZE, tmp_dir=None):
+    """
+    Diff two RDF graphs or files, grouping the differing triples by subject
+
+    :param old: rdflib Graph or filename
+    :param new: rdflib Graph or filename
+    :return: iterator of (subject, removed N-Triples lines, added N-Triples lines) in subject order
+    """
+    changes = diff_sorted(external_sort(ntriples_lines(old), chunk_size, tmp_dir),
+                          external_sort(ntriples_lines(new), chunk_size, tmp_dir))
+
+    for subject, subject_changes in itertools.groupby(changes, key=lambda change: subject_of(change[1])):
+        removed = []
+        added = []
+        for sign, line in subject_changes:
+            (removed if sign == '-' else added).append(line)
+        yield subject, removed, added
+
+
+if __name__ == "__main__":
+
+    argparser = argparse.ArgumentParser(description="Diff two RDF files without blank nodes")
+
+    argparser.add_argument("old", help="Old RDF file")
+    argparser.add_argument("new", help="New RDF file")
+    argparser.add_argument("--chunk-size", default=DEFAULT_CHUNK_SIZE, type=int,
+                           help="Number of triples sorted in memory at a time, default is %s." % DEFAULT_CHUNK_SIZE)
+    argparser.add_argument("--tmp-dir", default=None, help="Directory for temporary sort files")
+
+    args = argparser.parse_args()
+
+    differences = 0
+    for subject, removed, added in diff(args.old, args.new, args.chunk_size, args.tmp_dir):
+        print(subject)
+        for line in removed:
+            print('  - ' + line)
+        for line in added:
+            print('  + ' + line)
+        differences += len(removed) + len(added)
+
+    print('%s differing triples' % differences, file=sys.stderr)
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Flattened per-cemetery documents for search index bulk loading
+"""
+
+import datetime
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+# Converting a record takes some microseconds, so worker processes pay off only for large inputs
+PROCESS_THRESHOLD = 50000
+
+
+def cemetery_document(record, photo_url):
+    """
+    Create a flattened search document of a mapped cemetery row
+
+    :param record: dict with the cemetery 'uri', its 'labels', converted column 'values' and 'photos' as
+                   (column name, filename) tuples
+    :param photo_url: base URL of the photo files
+    :return: document dict
+    """
+    values = record['values']
+    names = values.get('nykyiset_kunnat') or {}
+    geodata = values.get('tarkka_katuosoite') or {}
+
+    doc = {
+        'id': record['uri'],
+        'cemetery_id': values.get('nro'),
+        'cemetery_type': values.get('tyyppi'),
+        'prefLabel': record['labels'].get('prefLabel'),
+        'altLabel': record['labels'].get('altLabel'),
+        'current_municipality': names.get('current_municipality'),
+        'former_municipality': names.get('former_municipality'),
+        'number_of_graves': values['hautoja'] if isinstance(values.get('hautoja'), int) else None,
+        'memorial': values.get('nimi'),
+        'memorial_sculptor': values.get('kuvanveistäjä'),
+        'architect': values.get('arkkitehti'),
+        'camera_club': values.get('kuvaukset_toteuttanut_kameraseura'),
+        'address': geodata.get('address'),
+        'location': {'lat': geodata['lat'], 'lon': geodata['lng']} if 'lat' in geodata else None,
+        'photos': [{'caption': column_name[7:].replace('_', ' ').capitalize(),
+                    'url': photo_url + '2048x1365px/' + filename,
+                    'thumbnail_url': photo_url + '300x200px/' + filename}
+                   for column_name, filename in record['photos']],
+    }
+
+    for column_name, name in (('perustettu', 'date_of_foundation'), ('paljastettu', 'memorial_unveiling_date')):
+        value = values.get(column_name)
+        doc[name] = value.isoformat() if isinstance(value, datetime.date) else value
+
+    return {key: value for key, value in doc.items() if value is not None}
+
+
+def bulk_lines(records, photo_url, index):
+    """
+    Create the bulk API NDJSON lines (an action line and a document line per cemetery) for a partition of records
+
+    :return: NDJSON string
+    """
+    lines = []
+    for record in records:
+        lines.append(json.dumps({'index': {'_index': index, '_id': record['uri']}}))
+        lines.append(json.dumps(cemetery_document(record, photo_url), ensure_ascii=False))
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def partitions(records, size):
+    records = iter(records)
+    partition = list(islice(records, size))
+    while partition:
+        yield partition
+        partition = list(islice(records, size))
+
+
+def write_documents(records, destination, photo_url, index='cemeteries', workers=1, partition_size=1000,
+                    process_threshold=PROCESS_THRESHOLD):
+    """
+    Write cemetery documents as NDJSON for a search engine's bulk API. With several workers and enough records,
+    partitions of records are converted in worker processes and written out in order as they complete. Smaller
+    inputs are converted in this process, because starting the processes costs more than the conversion.
+
+    Worker processes are spawned rather than forked, as the converter runs thread pools.
+
+    :param records: list of records as in cemetery_document
+    :param destination: NDJSON filename
+    :param photo_url: base URL of the photo files
+    :param index: name of the search index
+    :param workers: number of worker processes
+    :param partition_size: number of records per partition
+    :param process_threshold: minimum number of records converted in worker processes
+    """
+    with open(destination, 'w', encoding='UTF-8') as f:
+        if workers > 1 and len(records) >= process_threshold:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                for lines in executor.map(bulk_lines, partitions(records, partition_size),
+                                          repeat(photo_url), repeat(index)):
+                    f.write(lines)
+        else:
+            for partition in partitions(records, partition_size):
+                f.write(bulk_lines(partition, photo_url, index))
@@ -4,20 +4,73 @@
 Tests for data conversion
 """
 import datetime
+import functools
 import io
+import json
+import os
+import tempfile
+import threading
 from collections import defaultdict
 import unittest
 from pprint import pprint
 
-from approvaltests.Approvals import verify
-from rdflib import Graph, RDF, URIRef
+from rdflib import Dataset, Graph, RDF, URIRef
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
 from rdflib import Literal
 from rdflib import XSD
-from rdflib.compare import isomorphic, graph_diff
 
 import converters
-from csv_to_rdf import RDFMapper
-from mapping import PRISONER_MAPPING, DATA_NS, DC
+import rdf_diff
+from lookup_service import CemeteryIndex, LookupService, percentile
+from namespaces import CEMETERY_SCHEMA_NS, CIDOC, DC, GRAPHS_NS, SCHEMA_ORG, SKOS, WARSA_SCHEMA_NS
+from pipeline import pipelined
+from rdf_binary import BinaryRDF, write_binary
+from search_documents import write_documents
+from facets import FACET_PROPERTIES, FacetCounter
+from url_check import check_urls
+from csv_to_rdf import PHOTO_SIZES, RDFMapper, convert_batch, read_municipality_index, snapshot_files
+from mapping import CEMETERY_MAPPING
+
+
+def read_cemetery_rows(count):
+    """
+    Read the first rows of the cemetery CSV
+    """
+    mapper = RDFMapper({}, '')
+    mapper.read_csv('2017-12-29-cemeteries.csv')
+    return mapper.table.head(count).copy()
+
+
+def fake_geocode(raw_value):
+    return {'lat': 60.0, 'lng': 25.0, 'address': raw_value}
+
+
+# cemetery mapping that does not call the geocoding API
+OFFLINE_MAPPING = dict(CEMETERY_MAPPING)
+OFFLINE_MAPPING['tarkka_katuosoite'] = dict(CEMETERY_MAPPING['tarkka_katuosoite'], converter=fake_geocode)
+
+
+def convert_table(table, mapping=OFFLINE_MAPPING, row_cache=None, previous=None, **attributes):
+    """
+    Convert a table of cemetery rows without photo file checks
+
+    :param row_cache: row cache to use, None for no row cache
+    :param previous: mapper of a previous run to continue from, as in watch mode
+    :param attributes: RDFMapper attributes to set before converting
+    """
+    mapper = RDFMapper(mapping, WARSA_SCHEMA_NS.Cemetery)
+    mapper.read_narc_cemetery_uris_from_csv()
+    mapper.photo_index = {size: set() for size in PHOTO_SIZES}
+    for name, value in attributes.items():
+        setattr(mapper, name, value)
+    mapper.row_cache = row_cache
+    if previous:
+        mapper.row_cache = previous.row_cache
+        mapper.data, mapper.photographs, mapper.information_objects = (previous.data, previous.photographs,
+                                                                       previous.information_objects)
+    mapper.table = table
+    mapper.process_rows()
+    return mapper
 
 
 class TestConverters(unittest.TestCase):
@@ -52,11 +105,293 @@ class TestConverters(unittest.TestCase):
         self.assertEqual(converters.convert_person_name('Ahjo ent. Germanoff Juho ent. Ivan'),
                          ('Juho Ent. Ivan', 'Ahjo (ent. Germanoff)', 'Ahjo (ent. Germanoff), Juho Ent. Ivan'))
 
+    def test_split_person_names(self):
+        self.assertEqual(converters.split_person_names('Heikki HIrvonen'), ('Heikki Hirvonen',))
+        self.assertEqual(converters.split_person_names('Seppo Holopainen ja Heikki Simpura'),
+                         ('Seppo Holopainen', 'Heikki Simpura'))
+        self.assertEqual(converters.split_person_names('Lauri Koponen/Tero Lähdesmäki'),
+                         ('Lauri Koponen', 'Tero Lähdesmäki'))
+        self.assertEqual(converters.split_person_names('Paavo ja Jaana Haapamäki'),
+                         ('Paavo Haapamäki', 'Jaana Haapamäki'))
+        self.assertEqual(converters.split_person_names('ei'), ())
+
+    def test_cluster_person_names(self):
+        clusters = converters.cluster_person_names(['Ismo Holopainen', 'Ismo Holopainen', 'Ismo Holopanen',
+                                                    'Ismo HOLOPAINEN', 'Maija Tuominen', 'Raija Tuominen',
+                                                    'Kari Toivonen', 'Kari Tolonen', 'Esa Aho', 'Esa Ahl',
+                                                    'Juhani Valtola', 'Juhani Valtola', 'Johani Valtola'])
+        self.assertEqual(clusters['Ismo Holopanen'], 'Ismo Holopainen')
+        self.assertEqual(clusters['Ismo HOLOPAINEN'], 'Ismo Holopainen')
+        self.assertEqual(clusters['Raija Tuominen'], 'Raija Tuominen')
+        self.assertEqual(clusters['Kari Tolonen'], 'Kari Tolonen')
+        self.assertEqual(clusters['Esa Ahl'], 'Esa Ahl')
+        self.assertEqual(clusters['Johani Valtola'], 'Juhani Valtola')
+
+    def test_cluster_person_names_different_first_names(self):
+        clusters = converters.cluster_person_names(['Anna Virtanen', 'Anna Virtanen', 'Anne Virtanen',
+                                                    'Jari Sokka', 'Jani Sokka', 'Ismo Holopainen',
+                                                    'Isma Holopainen'])
+        self.assertEqual(clusters['Anne Virtanen'], 'Anne Virtanen')
+        self.assertEqual(clusters['Jari Sokka'], 'Jari Sokka')
+        self.assertEqual(clusters['Jani Sokka'], 'Jani Sokka')
+        self.assertEqual(clusters['Isma Holopainen'], 'Isma Holopainen')
+
+    def test_normalize_place_name(self):
+        self.assertEqual(converters.normalize_place_name(' Kylmäkoski '), 'kylmäkoski')
+        self.assertEqual(converters.normalize_place_name('Koski  Tl'), 'koski tl')
+        self.assertEqual(converters.normalize_place_name('Mänttä - Vilppula'), 'mänttä-vilppula')
+
+    def test_create_events(self):
+        a = URIRef('http://example.com/a')
+        b = URIRef('http://example.com/b')
+        g = Graph()
+        converters.create_events(g, ['foundation_a', 'foundation_b'], CIDOC.E63_Beginning_of_Existence,
+                                 CIDOC.P92_brought_into_existence, [a, b], ['A', 'B'],
+                                 ('Perustaminen: {name}', 'Foundation: {name}'),
+                                 timespans=[('1940-01-01', '1940-12-31'), ('1940-01-01', '1940-12-31')])
+
+        self.assertEqual(len(list(g.subjects(RDF.type, CIDOC.E63_Beginning_of_Existence))), 2)
+        self.assertEqual(len(list(g.subjects(RDF.type, CIDOC['E52_Time-Span']))), 1)
+        self.assertEqual(converters.date_timespan('1948'), ('1948-01-01', '1948-12-31'))
+        self.assertEqual(converters.date_timespan(datetime.date(1940, 1, 10)), ('1940-01-10', '1940-01-10'))
+        self.assertIsNone(converters.date_timespan('1947+1954'))
+
     def test_strip_dash(self):
         assert not converters.strip_dash('-')
         assert converters.strip_dash('Foo-Bar') == 'Foo-Bar'
 
 
+class TestPipeline(unittest.TestCase):
+
+    def test_pipelined_keeps_order(self):
+        results = list(pipelined(range(100), lambda x: x * 2, workers=4, max_pending=5))
+        self.assertEqual(results, [(x, x * 2) for x in range(100)])
+
+
+class TestRDFDiff(unittest.TestCase):
+
+    def test_external_sort(self):
+        lines = ['c', 'a', 'b', 'a', 'e', 'd']
+        self.assertEqual(list(rdf_diff.external_sort(lines, chunk_size=2)), ['a', 'b', 'c', 'd', 'e'])
+
+    def test_diff(self):
+        a = URIRef('http://example.com/a')
+        b = URIRef('http://example.com/b')
+        old = Graph()
+        old.add((a, RDF.type, URIRef('http://example.com/Class')))
+        old.add((a, DC.source, Literal('x')))
+        new = Graph()
+        new.add((a, RDF.type, URIRef('http://example.com/Class')))
+        new.add((b, DC.source, Literal('y')))
+
+        self.assertEqual(list(rdf_diff.diff(old, new, chunk_size=1)),
+                         [('<http://example.com/a>', ['<http://example.com/a> <http://purl.org/dc/terms/source> "x" .'], []),
+                          ('<http://example.com/b>', [], ['<http://example.com/b> <http://purl.org/dc/terms/source> "y" .'])])
+        self.assertEqual(list(rdf_diff.diff(old, old)), [])
+
+    def test_diff_formats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'a.nt'), 'w', encoding='UTF-8') as f:
+                f.write('<http://example.com/a> <http://example.com/p> "\\u00E4\\nb" .\n')
+            with open(os.path.join(directory, 'b.ttl'), 'w', encoding='UTF-8') as f:
+                f.write('<http://example.com/a> <http://example.com/p> """ä\nb""" .\n')
+
+            self.assertEqual(list(rdf_diff.diff(os.path.join(directory, 'a.nt'), os.path.join(directory, 'b.ttl'))),
+                             [])
+
+
+class TestRDFBinary(unittest.TestCase):
+
+    def test_round_trip(self):
+        a = URIRef('http://example.com/a')
+        graph = Graph()
+        graph.add((a, RDF.type, URIRef('http://example.com/Class')))
+        graph.add((a, SKOS.prefLabel, Literal('Hautausmaa "A"', lang='fi')))
+        graph.add((a, DC.date, Literal('1940-01-10', datatype=XSD.date)))
+
+        with tempfile.TemporaryDirectory() as destination:
+            write_binary({'data': graph, 'empty': Graph()}, destination)
+            binary = BinaryRDF(destination)
+
+            self.assertEqual(len(binary), 3)
+            self.assertEqual(set(binary.graph('data')), set(graph))
+            self.assertEqual(len(binary.graph('empty')), 0)
+            self.assertEqual(list(binary.triples('data', (a, SKOS.prefLabel, None))),
+                             [(a, SKOS.prefLabel, Literal('Hautausmaa "A"', lang='fi'))])
+            self.assertIsNone(binary.term_id(URIRef('http://example.com/b')))
+
+    def test_triple_patterns(self):
+        graph = Graph()
+        for i in range(20):
+            subject = URIRef('http://example.com/%s' % (i % 5))
+            graph.add((subject, URIRef('http://example.com/p%s' % (i % 3)), Literal(i)))
+
+        with tempfile.TemporaryDirectory() as destination:
+            write_binary({'data': graph}, destination)
+            binary = BinaryRDF(destination)
+
+            for s, p, o in graph:
+                for pattern in ((s, None, None), (s, p, None), (s, p, o), (None, p, None), (s, None, o), (None, None, o)):
+                    self.assertEqual(set(binary.triples('data', pattern)), set(graph.triples(pattern)))
+
+
+class TestSearchDocuments(unittest.TestCase):
+
+    def test_write_documents(self):
+        records = [{'uri': 'http://example.com/%s' % i,
+                    'labels': {'prefLabel': 'Akaa, Kylmäkosken sankarihautausmaa'},
+                    'values': {'nro': format(i, '03d'),
+                               'nykyiset_kunnat': {'current_municipality': 'Akaa', 'former_municipality': None},
+                               'hautoja': 115,
+                               'perustettu': datetime.date(1940, 1, 10),
+                               'tarkka_katuosoite': {'address': 'Lehtitie 3', 'lat': 60.0, 'lng': 25.0}},
+                    'photos': [('kuva_1_muistomerkki', 'a.jpg')]} for i in range(5)]
+
+        with tempfile.TemporaryDirectory() as destination:
+            for workers in (1, 2):
+                filename = os.path.join(destination, 'cemeteries.ndjson')
+                write_documents(records, filename, 'http://example.com/photos/', workers=workers, partition_size=2,
+                                process_threshold=0)
+                with open(filename, encoding='UTF-8') as f:
+                    lines = [json.loads(line) for line in f]
+
+                self.assertEqual(len(lines), 10)
+                self.assertEqual(lines[0], {'index': {'_index': 'cemeteries', '_id': 'http://example.com/0'}})
+                self.assertEqual([line['cemetery_id'] for line in lines[1::2]], ['000', '001', '002', '003', '004'])
+                doc = lines[1]
+                self.assertEqual(doc['current_municipality'], 'Akaa')
+                self.assertNotIn('former_municipality', doc)
+                self.assertEqual(doc['number_of_graves'], 115)
+                self.assertEqual(doc['date_of_foundation'], '1940-01-10')
+                self.assertEqual(doc['location'], {'lat': 60.0, 'lon': 25.0})
+                self.assertEqual(doc['photos'], [{'caption': 'Muistomerkki',
+                                                  'url': 'http://example.com/photos/2048x1365px/a.jpg',
+                                                  'thumbnail_url': 'http://example.com/photos/300x200px/a.jpg'}])
+
+
+class TestFacetCounter(unittest.TestCase):
+
+    def test_counts(self):
+        facets = FacetCounter()
+        facets.add({'current_municipality': 'Akaa', 'camera_club': 'Kiteen Kamerakerho'},
+                   {'graves_per_municipality': 115})
+        facets.add({'current_municipality': 'Akaa', 'camera_club': 'Kiteen kamerakerho'},
+                   {'graves_per_municipality': 20})
+        facets.add({'current_municipality': 'Alavus', 'camera_club': None}, {'graves_per_municipality': None})
+
+        self.assertEqual(facets.lookup(),
+                         {'facets': {'camera_club': {'Kiteen Kamerakerho': 1, 'Kiteen kamerakerho': 1},
+                                     'current_municipality': {'Akaa': 2, 'Alavus': 1}},
+                          'aggregates': {'graves_per_municipality': {'Akaa': 135}}})
+
+        graph = facets.graph()
+        akaa = graph.value(predicate=RDF.value, object=Literal('Akaa'))
+        self.assertEqual(graph.value(akaa, CEMETERY_SCHEMA_NS.number_of_cemeteries).toPython(), 2)
+        self.assertEqual(graph.value(akaa, CEMETERY_SCHEMA_NS.number_of_graves).toPython(), 135)
+        self.assertEqual(len(set(graph.subjects(CEMETERY_SCHEMA_NS.facet_property,
+                                                CEMETERY_SCHEMA_NS.camera_club))), 2)
+
+    def test_typed_values_and_schema(self):
+        facets = FacetCounter()
+        facets.add({'area': 3})
+        graph = facets.graph()
+        self.assertEqual(list(graph.objects(None, RDF.value)), [Literal(3, datatype=XSD.integer)])
+
+        schema = convert_table(read_cemetery_rows(2)).schema
+        self.assertIn((FACET_PROPERTIES['area'], RDF.type, RDF.Property), schema)
+        for uri in (CEMETERY_SCHEMA_NS.FacetValue, CEMETERY_SCHEMA_NS.facet_property,
+                    CEMETERY_SCHEMA_NS.number_of_cemeteries):
+            self.assertIsNotNone(schema.value(uri, SKOS.prefLabel))
+
+
+class TestURLCheck(unittest.TestCase):
+
+    def test_check_urls(self):
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+        published_url = 'https://example.com/photos/'
+        media = Graph()
+        for i, filename in enumerate(('a.jpg', 'b.jpg', 'a.jpg')):
+            media.add((URIRef('http://example.com/media/%s' % i), SCHEMA_ORG.contentUrl,
+                       URIRef(published_url + filename)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'a.jpg'), 'w') as f:
+                f.write('jpg')
+
+            class Handler(SimpleHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+            server = ThreadingHTTPServer(('localhost', 0), functools.partial(Handler, directory=directory))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                base_url = 'http://localhost:%s/' % server.server_port
+                cache_file = os.path.join(directory, 'cache', 'cache.json')
+                for url in (base_url, base_url[:-1]):
+                    broken = check_urls(media, published_url, base_url=url, workers=2, rate=0,
+                                        cache_file=cache_file)
+                    self.assertEqual(broken, {published_url + 'b.jpg': 404})
+            finally:
+                server.shutdown()
+                server.server_close()
+
+            with open(cache_file) as f:
+                cache = json.load(f)
+            self.assertEqual(cache[base_url + 'a.jpg']['status'], 200)
+            self.assertIsNotNone(cache[base_url + 'a.jpg']['last_modified'])
+
+
+class TestCemeteryIndex(unittest.TestCase):
+
+    def test_lookups(self):
+        cemetery = URIRef('http://ldf.fi/warsa/places/cemeteries/h0001_1')
+        data = Graph()
+        data.add((cemetery, RDF.type, WARSA_SCHEMA_NS.Cemetery))
+        data.add((cemetery, CEMETERY_SCHEMA_NS.cemetery_id, Literal('001')))
+        data.add((cemetery, CEMETERY_SCHEMA_NS.current_municipality, Literal('Akaa')))
+        data.add((cemetery, CEMETERY_SCHEMA_NS.former_municipality, Literal('Kylmäkoski')))
+        data.add((cemetery, SKOS.prefLabel, Literal('Akaa, Kylmäkosken sankarihautausmaa')))
+
+        index = CemeteryIndex(data, Graph(), Graph())
+
+        self.assertEqual(index.cemetery_by_id('1')[0]['@id'], str(cemetery))
+        self.assertEqual(len(index.cemeteries_by_municipality('kylmäkoski')), 1)
+        self.assertEqual(index.autocomplete('akaa, k'), [{'@id': str(cemetery),
+                                                          'label': 'Akaa, Kylmäkosken sankarihautausmaa'}])
+        self.assertEqual(index.autocomplete('b'), [])
+
+    def test_percentile(self):
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 25), 3)
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 91), 10)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 10)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_service(self):
+        cemetery = URIRef('http://ldf.fi/warsa/places/cemeteries/h0001_1')
+        photo = URIRef('http://ldf.fi/warsa/photographs/cemetery_photo_001_01')
+        data = Graph()
+        data.add((cemetery, RDF.type, WARSA_SCHEMA_NS.Cemetery))
+        data.add((cemetery, CEMETERY_SCHEMA_NS.cemetery_id, Literal('001')))
+        photographs = Graph()
+        photographs.add((photo, CIDOC.P138_represents, cemetery))
+        photographs.add((photo, DC.description, Literal('Muistomerkki', lang='fi')))
+
+        service = LookupService(CemeteryIndex(data, photographs, Graph()))
+
+        status, body = service.handle('/autocomplete?q=a&limit=x')
+        self.assertEqual(status, 400)
+
+        status, body = service.handle('/photos?id=1')
+        self.assertEqual(status, 200)
+        parsed = Graph().parse(data=body.decode('UTF-8'), format='json-ld')
+        self.assertEqual(set(parsed.objects(photo, DC.description)), {Literal('Muistomerkki', lang='fi')})
+
+
 class TestRDFMapper(unittest.TestCase):
 
     def test_read_value_with_source(self):
@@ -93,7 +428,173 @@ class TestRDFMapper(unittest.TestCase):
         mapper.read_csv('test_data.csv')
         assert len(mapper.table) == 2
 
+    def test_read_csv_snapshot(self):
+        mapper = RDFMapper({}, '')
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            mapper.read_csv('2017-12-29-cemeteries.csv', snapshot_dir=snapshot_dir)
+            parsed = mapper.table
+            assert len(os.listdir(snapshot_dir)) == 1
+
+            mapper.read_csv('2017-12-29-cemeteries.csv', snapshot_dir=snapshot_dir)
+            assert parsed.equals(mapper.table)
+
+    def test_snapshot_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for subdirectory, name in (('b', '2017-12-29-cemeteries.csv'), ('a', '2018-01-01-cemeteries.csv'),
+                                       ('c', '2018-01-01-cemeteries.csv')):
+                os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+                open(os.path.join(directory, subdirectory, name), 'w').close()
+
+            self.assertEqual(snapshot_files([os.path.join(directory, 'a', '*.csv'),
+                                             os.path.join(directory, 'b', '*.csv')]),
+                             [os.path.join(directory, 'b', '2017-12-29-cemeteries.csv'),
+                              os.path.join(directory, 'a', '2018-01-01-cemeteries.csv')])
+            with self.assertRaises(ValueError):
+                snapshot_files([os.path.join(directory, '*', '*.csv')])
+
+    def test_ei_ole_rows_are_not_resolved(self):
+        addresses = []
+
+        def geocode(raw_value):
+            addresses.append(raw_value)
+            return {'lat': 60.0, 'lng': 25.0, 'address': raw_value}
+
+        mapping = dict(OFFLINE_MAPPING)
+        mapping['tarkka_katuosoite'] = dict(mapping['tarkka_katuosoite'], converter=geocode)
+        table = read_cemetery_rows(2)
+        table['tarkka_katuosoite'] = ['Lehtitie 3, 37910 Kylmäkoski', 'Nowhere 1']
+        table.loc[1, 'tyyppi'] = 'ei_ole'
+
+        mapper = convert_table(table, mapping)
+
+        self.assertEqual(addresses, ['Lehtitie 3, 37910 Kylmäkoski'])
+        self.assertEqual(len(set(mapper.data.subjects(RDF.type, WARSA_SCHEMA_NS.Cemetery))),
+                         1 + mapper.cemeteries_in_warsampo_not_project)
+
+    def test_municipality_links(self):
+        akaa = URIRef('http://example.com/municipalities/akaa')
+        kylmakoski = URIRef('http://example.com/municipalities/kylmakoski')
+
+        with tempfile.TemporaryDirectory() as directory:
+            gazetteer = os.path.join(directory, 'municipalities.csv')
+            with open(gazetteer, 'w', encoding='UTF-8') as f:
+                f.write('uri,label,aliases\n'
+                        '%s,Akaan kaupunki,Akaa;Toijalan kauppala\n'
+                        '%s,Kylmäkoski,\n' % (akaa, kylmakoski))
+            municipalities = read_municipality_index(gazetteer)
+
+        self.assertEqual(municipalities, {'akaan kaupunki': akaa, 'akaa': akaa, 'toijalan kauppala': akaa,
+                                          'kylmäkoski': kylmakoski})
+
+        with self.assertLogs('csv_to_rdf', level='WARNING') as logs:
+            # Akaa / Kylmäkoski and Akaa / Toijala, Toijala is not in the gazetteer
+            mapper = convert_table(read_cemetery_rows(2), municipalities=municipalities)
+            mapper.find_municipality('Toijala')
+
+        self.assertEqual([line for line in logs.output if 'gazetteer' in line],
+                         ['WARNING:csv_to_rdf:municipality not found in gazetteer: Toijala'])
+
+        cemetery = mapper.data.value(predicate=CEMETERY_SCHEMA_NS.former_municipality,
+                                     object=Literal('Kylmäkoski'))
+        self.assertEqual(mapper.data.value(cemetery, CEMETERY_SCHEMA_NS.located_in_current_municipality), akaa)
+        self.assertEqual(mapper.data.value(cemetery, CEMETERY_SCHEMA_NS.located_in_former_municipality),
+                         kylmakoski)
+
+        toijala = mapper.data.value(predicate=CEMETERY_SCHEMA_NS.former_municipality, object=Literal('Toijala'))
+        self.assertEqual(mapper.data.value(toijala, CEMETERY_SCHEMA_NS.located_in_current_municipality), akaa)
+        self.assertIsNone(mapper.data.value(toijala, CEMETERY_SCHEMA_NS.located_in_former_municipality))
+
+        for prop in (CEMETERY_SCHEMA_NS.located_in_current_municipality,
+                     CEMETERY_SCHEMA_NS.located_in_former_municipality):
+            self.assertIn((prop, RDF.type, RDF.Property), mapper.schema)
+            self.assertEqual(len(list(mapper.schema.objects(prop, SKOS.prefLabel))), 2)
+
+    def test_row_cache_matches_fresh_conversion(self):
+        table = read_cemetery_rows(4)
+        edited = table.copy()
+        edited.loc[0, 'hautausmaan_nimi'] = 'Muutettu hautausmaa'
+        edited.loc[0, 'perustettu'] = '1941'
+        edited.loc[1, 'kuva_1_kuvaajan_nimi'] = 'Uusi Kuvaaja'
+        edited = edited.drop(index=2).reset_index(drop=True)
+
+        previous = convert_table(table, row_cache={})
+        for new_table in (edited, table):
+            cached = convert_table(new_table, previous=previous)
+            fresh = convert_table(new_table)
+
+            self.assertLess(cached.rows_mapped, fresh.rows_mapped)
+            for name in ('data', 'photographs', 'information_objects'):
+                self.assertEqual(set(getattr(cached, name)), set(getattr(fresh, name)), name)
+            previous = cached
+
+    def test_convert_batch_changelog(self):
+        table = read_cemetery_rows(3)
+        # no addresses, so nothing is geocoded
+        table['tarkka_katuosoite'] = ''
+        edited = table.copy()
+        edited.loc[0, 'hautausmaan_nimi'] = 'Muutettu hautausmaa'
+        edited = edited.drop(index=2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            table.to_csv(os.path.join(directory, '2018-01-01-cemeteries.csv'), index=False)
+            edited.to_csv(os.path.join(directory, '2018-02-01-cemeteries.csv'), index=False)
+            output = os.path.join(directory, 'output') + '/'
+
+            convert_batch([os.path.join(directory, '*.csv')], output, loglevel='WARNING', parallel=2, changelog=True)
+
+            self.assertTrue(os.path.isfile(output + '2018-02-01-cemeteries/cemeteries.ttl'))
+            with open(output + 'changelog.txt', encoding='UTF-8') as f:
+                changelog = f.read().splitlines()
+
+        # the deleted row is still a cemetery from the NARC data, only its photography project data is removed
+        self.assertEqual(changelog, [
+            '2018-01-01-cemeteries -> 2018-02-01-cemeteries',
+            '  changed: http://ldf.fi/warsa/events/cemetery_foundation_h0218_1 (+2 -2)',
+            '  removed: http://ldf.fi/warsa/events/cemetery_foundation_h0245_1',
+            '  changed: http://ldf.fi/warsa/events/cemetery_memorial_unveiling_h0218_1 (+2 -2)',
+            '  removed: http://ldf.fi/warsa/events/cemetery_memorial_unveiling_h0245_1',
+            '  removed: http://ldf.fi/warsa/events/timespan_1948-01-01_1948-12-31',
+            '  removed: http://ldf.fi/warsa/events/timespan_1948-06-20',
+            '  changed: http://ldf.fi/warsa/places/cemeteries/h0218_1 (+1 -1)',
+            '  changed: http://ldf.fi/warsa/places/cemeteries/h0245_1 (+1 -15)',
+        ])
+
+    def test_photographer_slug_collision(self):
+        table = read_cemetery_rows(2)
+        table['kuva_1_kuvaajan_nimi'] = ['Åke Berg', 'Ake Berg']
+
+        mapper = convert_table(table)
+
+        self.assertEqual(mapper.photographers['Ake Berg'],
+                         [URIRef('http://ldf.fi/warsa/actors/cemetery_photographer_ake-berg')])
+        self.assertEqual(mapper.photographers['Åke Berg'],
+                         [URIRef('http://ldf.fi/warsa/actors/cemetery_photographer_ake-berg_2')])
+        self.assertEqual(str(mapper.photographs.value(mapper.photographers['Åke Berg'][0], SKOS.prefLabel)),
+                         'Åke Berg')
+
+    def test_serialize_quads(self):
+        mapper = RDFMapper({}, '')
+        cemetery = URIRef('http://ldf.fi/warsa/places/cemeteries/h0001_1')
+        source = URIRef('http://ldf.fi/warsa/sources/source21')
+        mapper.data.add((cemetery, SKOS.prefLabel, Literal('Akaa, "Kylmäkoski"\nhautausmaa')))
+        mapper.data.add((cemetery, DC.source, source))
+        mapper.schema.add((CEMETERY_SCHEMA_NS.memorial, RDF.type, RDF.Property))
+
+        with tempfile.TemporaryDirectory() as destination:
+            for format, filename in (('nquads', 'cemeteries.nq'), ('trig', 'cemeteries.trig')):
+                mapper.serialize_quads(os.path.join(destination, filename), format=format)
+                dataset = Dataset()
+                dataset.parse(os.path.join(destination, filename), format=format)
+
+                self.assertEqual(set(dataset.graph(GRAPHS_NS['cemeteries'])), set(mapper.data))
+                self.assertEqual(set(dataset.graph(GRAPHS_NS['cemeteries-schema'])), set(mapper.schema))
+                self.assertEqual(set(dataset.graph(DATASET_DEFAULT_GRAPH_ID)),
+                                 {(GRAPHS_NS['cemeteries'], DC.source, source)})
+
     def test_mapping_field_contents(self):
+        # PRISONER_MAPPING is imported here, so that the rest of the module can be run without it
+        from mapping import PRISONER_MAPPING
+
         instance_class = URIRef('http://example.com/Class')
 
         mapper = RDFMapper(PRISONER_MAPPING, instance_class)
@@ -105,15 +606,12 @@ class TestRDFMapper(unittest.TestCase):
         # g.serialize('test_data.ttl', format="turtle")  # Decomment to update file, and verify it by hand
         g2 = Graph().parse('test_data.ttl', format='turtle')
 
-        diffs = graph_diff(g, g2)
-
-        print('In new:')
-        pprint([d for d in diffs[1]])
+        diffs = list(rdf_diff.diff(g2, g))
 
-        print('In old:')
-        pprint([d for d in diffs[2]])
+        print('Differences (old, new):')
+        pprint(diffs)
 
-        assert isomorphic(g, g2)  # Isomorphic graph comparison
+        assert not diffs  # Canonical N-Triples comparison, the data has no blank nodes
 
 if __name__ == '__main__':
     unittest.main()
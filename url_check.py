@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Reachability check of the published photo URLs of a media graph
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from rdflib import Graph
+
+from namespaces import *
+
+log = logging.getLogger(__name__)
+
+
+def content_urls(information_objects):
+    """
+    Distinct contentUrls of a media graph
+
+    :param information_objects: rdflib Graph or Turtle filename
+    :return: sorted list of URL strings
+    """
+    if not isinstance(information_objects, Graph):
+        information_objects = Graph().parse(information_objects, format='turtle')
+    return sorted(set(str(url) for url in information_objects.objects(None, SCHEMA_ORG.contentUrl)))
+
+
+def rebase_url(url, published_url, base_url):
+    """
+    Replace the published base URL of a URL, e.g. to check the files on a local static file server. A missing
+    trailing slash of base_url is added if published_url has one.
+    """
+    if base_url and published_url.endswith('/') and not base_url.endswith('/'):
+        base_url += '/'
+    if base_url and url.startswith(published_url):
+        return base_url + url[len(published_url):]
+    return url
+
+
+class HostRateLimiter:
+    """
+    Space out the requests to each host to at most rate requests per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot.get(host, now), now)
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class URLChecker:
+    """
+    Check URLs concurrently with HEAD requests over a pooled keep-alive session. Validators (ETag, Last-Modified)
+    of earlier results are sent as conditional headers, and a 304 response reuses the cached result.
+    """
+
+    def __init__(self, workers=8, rate=10, timeout=10, cache_file=None):
+        """
+        :param workers: maximum number of concurrent requests
+        :param rate: maximum number of requests per second to a host, 0 for no limit
+        :param timeout: request timeout in seconds
+        :param cache_file: JSON file of results from earlier runs, not used if None
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.rate_limiter = HostRateLimiter(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.cache = {}
+        if cache_file:
+            # fail before the requests rather than when writing the results
+            os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, encoding='UTF-8') as f:
+                self.cache = json.load(f)
+
+    def check(self, url):
+        """
+        Check a single URL
+
+        :return: result dict with 'status' (None on connection errors) and the validators of the response
+        """
+        cached = self.cache.get(url)
+        headers = {}
+        if cached and cached['status'] == 200:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        self.rate_limiter.wait(url)
+        try:
+            response = self.session.head(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException as e:
+            log.warning('%s: %s' % (url, e))
+            return {'status': None}
+
+        if response.status_code == 304 and cached:
+            return dict(cached, cached=True)
+
+        return {'status': response.status_code,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+
+    def check_all(self, urls):
+        """
+        Check URLs concurrently and update the cache file
+
+        :param urls: iterable of URLs
+        :return: dict of URL -> result dict
+        """
+        urls = list(urls)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = dict(zip(urls, executor.map(self.check, urls)))
+
+        self.cache.update({url: {key: value for key, value in result.items() if key != 'cached'}
+                           for url, result in results.items() if result['status'] is not None})
+        if self.cache_file:
+            with open(self.cache_file, 'w', encoding='UTF-8') as f:
+                json.dump(self.cache, f, indent=2, sort_keys=True)
+
+        log.info('Checked %s URLs, %s unchanged since the last run' %
+                 (len(results), sum(1 for result in results.values() if result.get('cached'))))
+        return results
+
+
+def check_urls(information_objects, published_url, base_url=None, workers=8, rate=10, cache_file=None):
+    """
+    Check that the contentUrls of a media graph resolve
+
+    :param information_objects: rdflib Graph or Turtle filename of the media graph
+    :param published_url: base URL the contentUrls are published under
+    :param base_url: base URL to check instead of published_url, e.g. a local static file server
+    :return: dict of broken contentUrl -> HTTP status, None for connection errors
+    """
+    urls = {rebase_url(url, published_url, base_url): url for url in content_urls(information_objects)}
+    results = URLChecker(workers=workers, rate=rate, cache_file=cache_file).check_all(urls)
+
+    broken = {urls[url]: result['status'] for url, result in results.items() if result['status'] != 200}
+    for url, status in sorted(broken.items()):
+        log.warning('broken URL (%s): %s' % (status, url))
+    return broken